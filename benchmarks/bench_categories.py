@@ -0,0 +1,51 @@
+'''
+Measures category lookups through goodwill.db, both sqlite queries and the in memory index.\n
+Lookups open goodwill/categories.sqlite read only so running this never changes it.\n
+Run from the repo root with: python -m benchmarks.bench_categories
+'''
+from goodwill import db
+from goodwill.category_search import searchCategories
+
+from benchmarks.harness import perSecond
+
+SAMPLE_SIZE = 50
+
+# What people type into the category autocomplete, including partial words and typos
+QUERIES = ["", "cloth", "mens cl", "nintendo", "nintndo gam", "jewelry > watches", "28"]
+
+
+def sampleCategories(count: int = SAMPLE_SIZE) -> list:
+    '''
+    Categories spread evenly over the whole table so every level of the tree is looked up.
+    '''
+    categories = sorted(db.getIndex().byId.values(), key = lambda category: category.categoryId)
+    step = max(1, len(categories) // count)
+
+    return categories[::step][:count]
+
+
+def run() -> dict:
+    categories = sampleCategories()
+    per = len(categories)
+
+    return {
+        "sqlite": {
+            "getQuery_id_per_sec": perSecond(lambda : [db.getQuery(cat_id = category.categoryId) for category in categories], number = 20, per = per),
+            "getQuery_name_per_sec": perSecond(lambda : [db.getQuery(cat_name = category.categoryName) for category in categories], number = 20, per = per),
+            "getCategoriesByPar_per_sec": perSecond(lambda : [db.getCategoriesByPar(category.categoryId) for category in categories], number = 20, per = per),
+            "loadIndex_per_sec": perSecond(db.loadIndex, repeat = 3, number = 5),
+        },
+        "index": {
+            "getCategoryIds_per_sec": perSecond(lambda : [category.getCategoryIds() for category in categories], per = per),
+            "getParentCat_per_sec": perSecond(lambda : [category.getParentCat() for category in categories], per = per),
+            "hasChildren_per_sec": perSecond(lambda : [db.hasChildren(category.categoryId) for category in categories], per = per),
+        },
+        "searchCategories": {
+            "per_sec": perSecond(lambda : [searchCategories(query) for query in QUERIES], number = 50, per = len(QUERIES)),
+        },
+    }
+
+
+if __name__ == "__main__":
+    for name, result in run().items():
+        print(f"{name:<18}" + "  ".join(f"{key} {value:>10,.0f}" for key, value in result.items()))
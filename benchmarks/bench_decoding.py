@@ -0,0 +1,83 @@
+'''
+Compares json backends and field projection on recorded responses.\n
+Run from the repo root with: python -m benchmarks.bench_decoding
+'''
+import sys
+
+from goodwill import decoding
+from goodwill.dataclasses import Listing
+
+from benchmarks.harness import loadRaw, perSecond, ITEM_LISTING, ITEM_DETAIL
+
+
+def availableBackends() -> list[str]:
+    backends = []
+
+    for name in ("json", "ujson", "orjson"):
+        try:
+            decoding.setBackend(name)
+
+        except ImportError:
+            continue
+
+        backends.append(name)
+
+    return backends
+
+
+def retainedSize(data) -> int:
+    '''
+    Recursive size of decoded json, what an item detail cache entry holds on to.
+    '''
+    size = sys.getsizeof(data)
+
+    if isinstance(data, dict):
+        size += sum(sys.getsizeof(key) + retainedSize(value) for key, value in data.items())
+
+    elif isinstance(data, list):
+        size += sum(retainedSize(item) for item in data)
+
+    return size
+
+
+def run() -> dict:
+    default_backend = decoding.BACKEND
+
+    item_listing = loadRaw(ITEM_LISTING)
+    item_detail = loadRaw(ITEM_DETAIL)
+
+    projection = decoding.ITEM_DETAIL_PROJECTION
+    results = {}
+
+    try:
+        for backend in availableBackends():
+            decoding.setBackend(backend)
+
+            results[backend] = {
+                "item_listing_loads_per_sec": perSecond(lambda : decoding.loads(item_listing), number = 500),
+                "item_detail_loads_per_sec": perSecond(lambda : decoding.loads(item_detail)),
+                "item_detail_loads_project_per_sec": perSecond(lambda : decoding.project(decoding.loads(item_detail), projection)),
+                "item_detail_to_listing_per_sec": perSecond(lambda : Listing.fromDict(decoding.project(decoding.loads(item_detail), projection), 1)),
+            }
+
+    finally:
+        decoding.setBackend(default_backend)
+
+    detail = decoding.loads(item_detail)
+
+    results["retained_bytes"] = {
+        "item_detail_full": retainedSize(detail),
+        "item_detail_projected": retainedSize(decoding.project(detail, projection)),
+    }
+
+    return results
+
+
+if __name__ == "__main__":
+    results = run()
+    retained = results.pop("retained_bytes")
+
+    for backend, result in results.items():
+        print(f"{backend:<8}" + "  ".join(f"{key} {value:>10,.0f}" for key, value in result.items()))
+
+    print(f"retained item detail: full {retained['item_detail_full']:,} bytes, projected {retained['item_detail_projected']:,} bytes")
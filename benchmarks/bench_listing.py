@@ -0,0 +1,74 @@
+'''
+Compares Listing.fromDict against CompactListing for a recorded Search/ItemListing page.\n
+Run from the repo root with: python -m benchmarks.bench_listing
+'''
+import json
+import timeit
+import tracemalloc
+
+from goodwill.dataclasses import Listing, CompactListing
+
+from benchmarks.harness import loadItems
+
+
+def buildListing(items: list[dict]):
+    return [Listing.fromDict(item, 0) for item in items]
+
+
+def buildCompact(items: list[dict]):
+    return [CompactListing(item) for item in items]
+
+
+def render(listings):
+    # Same attributes Embeds.page reads
+    return [f"{listing.title} ${listing.currentPrice} | {listing.remainingTime}\n{listing.url}" for listing in listings]
+
+
+def objectsPerSecond(func, items: list[dict], repeat: int = 5, number: int = 200) -> float:
+    best = min(timeit.repeat(lambda : func(items), repeat = repeat, number = number))
+
+    return len(items) * number / best
+
+
+def bytesPerListing(func, items: list[dict], copies: int = 25) -> float:
+    '''
+    Memory allocated by the listings themselves, the decoded json is allocated before tracing starts.
+    '''
+    pages = [json.loads(json.dumps(items)) for _ in range(copies)]
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+
+    built = [func(page) for page in pages]
+
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+
+    return allocated / (len(items) * copies)
+
+
+def run() -> dict:
+    items = loadItems()
+
+    results = {}
+
+    for name, func in (("Listing", buildListing), ("CompactListing", buildCompact)):
+        results[name] = {
+            "build_per_sec": objectsPerSecond(func, items),
+            "build_and_render_per_sec": objectsPerSecond(lambda page : render(func(page)), items),
+            "bytes_per_listing": bytesPerListing(func, items),
+        }
+
+    return results
+
+
+if __name__ == "__main__":
+    for name, result in run().items():
+        print(
+            f"{name:<16}"
+            f"build {result['build_per_sec']:>10,.0f}/s  "
+            f"build+render {result['build_and_render_per_sec']:>10,.0f}/s  "
+            f"{result['bytes_per_listing']:>6,.0f} bytes/listing"
+        )
@@ -0,0 +1,43 @@
+'''
+Measures building search request bodies and their cache keys.\n
+Run from the repo root with: python -m benchmarks.bench_params
+'''
+import json
+
+from goodwill.dataclasses import KeywordSearch
+
+from benchmarks.harness import perSecond
+
+
+def categoryParams():
+    # Same as a /search with a category picked, for Men's Clothing
+    return KeywordSearch.initParams(
+        paramType = 1,
+        catIds = "-1,10,28",
+        categoryId = 28,
+        categoryLevel = 2,
+        categoryLevelNo = "2",
+        searchText = "Vintage  Pendleton wool",
+    )
+
+
+def run() -> dict:
+    item_listing = categoryParams()
+    item_listing_data = KeywordSearch.initParams(paramType = 0, st = "Vintage  Pendleton wool")
+
+    return {
+        "ItemListingParams": {
+            "toJson_per_sec": perSecond(item_listing.toJson, number = 20000),
+            "toJson_dumps_per_sec": perSecond(lambda : json.dumps(item_listing.toJson()), number = 20000), # The request body as sent
+            "cacheKey_per_sec": perSecond(item_listing.cacheKey, number = 20000),
+        },
+        "ItemListingDataParams": {
+            "toUrl_per_sec": perSecond(item_listing_data.toUrl, number = 20000),
+            "cacheKey_per_sec": perSecond(item_listing_data.cacheKey, number = 20000),
+        },
+    }
+
+
+if __name__ == "__main__":
+    for name, result in run().items():
+        print(f"{name:<22}" + "  ".join(f"{key} {value:>10,.0f}" for key, value in result.items()))
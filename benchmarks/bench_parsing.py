@@ -0,0 +1,54 @@
+'''
+Measures turning recorded api responses into listings and shipping quotes.\n
+Run from the repo root with: python -m benchmarks.bench_parsing
+'''
+from goodwill import db # Defines SimpleListing.getCategoryName
+from goodwill.base import strpdeltatime
+from goodwill.dataclasses import Listing, SimpleListing
+from goodwill.shipping import parseShipping
+
+from benchmarks.harness import (
+    loadItems, loadJson, loadText, perSecond,
+    ITEM_LISTING, ITEM_LISTING_DATA, ITEM_DETAIL, CALCULATE_SHIPPING
+)
+
+# Forms remainingTime takes besides the ones in the recorded pages
+EXTRA_TIMES = ["Auction Ended", "", "45s", "12m", "9m 30s"]
+
+
+def remainingTimes(*pages: list[dict]) -> list[str]:
+    '''
+    Every remainingTime in pages plus the forms which only show up near or after the end of an auction.
+    '''
+    return [item["remainingTime"] for page in pages for item in page] + EXTRA_TIMES
+
+
+def run() -> dict:
+    item_listing = loadItems(ITEM_LISTING)
+    item_listing_data = loadItems(ITEM_LISTING_DATA)
+    item_detail = loadJson(ITEM_DETAIL)
+    shipping = loadText(CALCULATE_SHIPPING)
+
+    times = remainingTimes(item_listing, item_listing_data)
+
+    return {
+        "Listing.fromDict": {
+            "item_listing_per_sec": perSecond(lambda : [Listing.fromDict(item, 0) for item in item_listing], number = 200, per = len(item_listing)),
+            "item_listing_data_per_sec": perSecond(lambda : [Listing.fromDict(item, 0) for item in item_listing_data], number = 200, per = len(item_listing_data)),
+            "item_detail_per_sec": perSecond(lambda : Listing.fromDict(item_detail, 1)),
+        },
+        "SimpleListing.fromDict": {
+            "item_detail_per_sec": perSecond(lambda : SimpleListing.fromDict(item_detail)),
+        },
+        "strpdeltatime": {
+            "per_sec": perSecond(lambda : [strpdeltatime(time) for time in times], number = 200, per = len(times)),
+        },
+        "parseShipping": {
+            "calculate_shipping_per_sec": perSecond(lambda : parseShipping(shipping, item_detail["itemId"], "98409")),
+        },
+    }
+
+
+if __name__ == "__main__":
+    for name, result in run().items():
+        print(f"{name:<24}" + "  ".join(f"{key} {value:>10,.0f}" for key, value in result.items()))
@@ -0,0 +1,34 @@
+'''
+Measures building search result embeds from recorded search pages.\n
+Run from the repo root with: python -m benchmarks.bench_rendering
+'''
+from discord_bot import Embeds
+from goodwill.dataclasses import Listing, CompactListing
+
+from benchmarks.harness import loadItems, perSecond, ITEM_LISTING, ITEM_LISTING_DATA
+
+
+def run() -> dict:
+    results = {}
+
+    for fixture in (ITEM_LISTING, ITEM_LISTING_DATA):
+        items = loadItems(fixture)
+
+        pages = {
+            "Listing": [Listing.fromDict(item, 0) for item in items],
+            "CompactListing": [CompactListing(item) for item in items],
+        }
+
+        for name, listings in pages.items():
+            results[f"{fixture.split('.')[0]}.{name}"] = {
+                "pages_per_sec": perSecond(lambda : Embeds.page("vintage", "All", listings, 1, 88), number = 500),
+                # Including the payload discord.py serializes when the embed is sent
+                "pages_to_dict_per_sec": perSecond(lambda : Embeds.page("vintage", "All", listings, 1, 88).to_dict(), number = 500),
+            }
+
+    return results
+
+
+if __name__ == "__main__":
+    for name, result in run().items():
+        print(f"{name:<34}" + "  ".join(f"{key} {value:>10,.0f}" for key, value in result.items()))
@@ -0,0 +1,43 @@
+'''
+Helpers shared by the benchmark modules, every fixture is a recorded api response so nothing touches the network.
+'''
+import json
+import os
+import timeit
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+# Recorded responses for each endpoint the bot parses
+ITEM_LISTING = "item_listing.json" # POST Search/ItemListing
+ITEM_LISTING_DATA = "item_listing_data.json" # GET Search/ItemListingData
+ITEM_DETAIL = "item_detail.json" # GET ItemDetail/GetItemDetailModelByItemId
+CALCULATE_SHIPPING = "calculate_shipping.html" # POST ItemDetail/CalculateShipping
+
+
+def loadRaw(name: str) -> bytes:
+    with open(os.path.join(FIXTURES, name), "rb") as fixture:
+        return fixture.read()
+
+
+def loadText(name: str) -> str:
+    with open(os.path.join(FIXTURES, name), encoding = "utf-8") as fixture:
+        return fixture.read()
+
+
+def loadJson(name: str):
+    with open(os.path.join(FIXTURES, name), encoding = "utf-8") as fixture:
+        return json.load(fixture)
+
+
+def loadItems(name: str = ITEM_LISTING) -> list[dict]:
+    '''
+    Returns the listings of a recorded search page.
+    '''
+    return loadJson(name)["searchResults"]["items"]
+
+
+def perSecond(func, repeat: int = 5, number: int = 2000, per: int = 1) -> float:
+    '''
+    Best of repeat runs, per is how many objects a single call handles.
+    '''
+    return per * number / min(timeit.repeat(func, repeat = repeat, number = number))
@@ -0,0 +1,140 @@
+'''
+Runs every benchmark and prints the results as json so runs from different commits can be compared.\n
+Run from the repo root with: python -m benchmarks.run [--only parsing,params] [--output results.json] [--compare baseline.json]
+'''
+import argparse
+import importlib
+import json
+import platform
+import subprocess
+import sys
+
+from datetime import datetime, timezone
+
+# Each is a module benchmarks.bench_<name> with a run function returning {group: {metric: value}}
+BENCHMARKS = ("parsing", "listing", "decoding", "rendering", "categories", "params")
+
+# Changes smaller than this are treated as noise when comparing
+DEFAULT_THRESHOLD = 0.1
+
+
+def gitCommit() -> str | None:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output = True, text = True, check = True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output = True, text = True, check = True).stdout.strip()
+
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return f"{commit}-dirty" if dirty else commit
+
+
+def runAll(names: list[str]) -> dict:
+    # Read before anything runs so the result names the tree that was measured
+    commit = gitCommit()
+    results = {}
+
+    for name in names:
+        module = importlib.import_module(f"benchmarks.bench_{name}")
+
+        print(f"Running {name}", file = sys.stderr)
+        results[name] = module.run()
+
+    return {
+        "commit": commit,
+        "created": datetime.now(timezone.utc).isoformat(timespec = "seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def _flatten(results: dict, prefix: str = "") -> dict[str, float]:
+    flat = {}
+
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+
+        else:
+            flat[f"{prefix}{key}"] = value
+
+    return flat
+
+
+def compare(baseline: dict, current: dict, threshold: float = DEFAULT_THRESHOLD) -> list[tuple[str, float, float, float]]:
+    '''
+    Returns (metric, baseline, current, change) for every metric present in both runs which moved by more than threshold.\n
+    Rates are higher is better, byte counts are lower is better, change is the ratio against baseline minus 1.
+    '''
+    before = _flatten(baseline["results"])
+    after = _flatten(current["results"])
+
+    changes = []
+
+    for metric, old in before.items():
+        new = after.get(metric)
+
+        if new is None or not old:
+            continue
+
+        change = new / old - 1
+
+        if abs(change) > threshold:
+            changes.append((metric, old, new, change))
+
+    return changes
+
+
+def isRegression(metric: str, change: float) -> bool:
+    if metric.endswith("_per_sec"):
+        return change < 0
+
+    return change > 0 # Bytes
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description = "Offline benchmarks against recorded goodwill responses")
+    parser.add_argument("--only", help = f"Comma separated benchmarks to run, from {','.join(BENCHMARKS)}")
+    parser.add_argument("--output", help = "Write the json results to this file instead of stdout")
+    parser.add_argument("--compare", help = "Json results of an earlier run, regressions are listed and exit with 1")
+    parser.add_argument("--threshold", type = float, default = DEFAULT_THRESHOLD, help = "Relative change treated as noise when comparing")
+
+    args = parser.parse_args()
+
+    names = args.only.split(",") if args.only else list(BENCHMARKS)
+
+    unknown = [name for name in names if name not in BENCHMARKS]
+
+    if unknown:
+        parser.error(f"Unknown benchmarks: {', '.join(unknown)}")
+
+    current = runAll(names)
+    output = json.dumps(current, indent = 2)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+
+    else:
+        print(output)
+
+    if not args.compare:
+        return 0
+
+    with open(args.compare) as file:
+        baseline = json.load(file)
+
+    regressed = False
+
+    for metric, old, new, change in compare(baseline, current, args.threshold):
+        regression = isRegression(metric, change)
+        regressed = regressed or regression
+
+        print(f"{'REGRESSION' if regression else 'improved':<10} {metric}: {old:,.0f} -> {new:,.0f} ({change:+.1%})", file = sys.stderr)
+
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
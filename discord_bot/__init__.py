@@ -3,8 +3,10 @@ from discord_bot import base
 from discord_bot import embeds as Embeds
 from discord_bot import reminders
 
-TEMPUSERDATA = reminders.TempDataList([])
-TEMPUSERDATA.initList()
+TEMPUSERDATA = reminders.UserStore()
+
+# Users whose thread was deleted stop being sent to until they get a new one
+reminders.notificationQueue.onThreadGone = TEMPUSERDATA.forgetThread
 
 from discord_bot import views
 from discord_bot import cogs
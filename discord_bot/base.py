@@ -1,10 +1,17 @@
-import aiohttp
+import asyncio
 import discord
 import json
+import logging
+import os
+import tempfile
 
 from discord import Webhook
 from discord.ext import commands
 
+from goodwill.client import HttpClient
+
+log = logging.getLogger(__name__)
+
 
 def isAdmin():
     '''
@@ -22,69 +29,312 @@ def isAdmin():
 
 
 # Webhook functions
-async def getWebhook(guild: discord.Guild):
+# Resolved once per guild and per user, sending a notification is then a single request
+_webhooks: dict[int, Webhook] = {}
+_threads: dict[tuple[int, int], discord.Thread] = {} # Keyed by (guild id, user id)
+
+# Discord gets its own pool so webhook sends never queue behind or share connection limits with goodwill requests
+webhookClient = HttpClient(limit = 20, limitPerHost = 10)
+
+# Discord error codes
+UNKNOWN_CHANNEL = 10003
+UNKNOWN_WEBHOOK = 10015
+
+async def getWebhook(guild: discord.Guild) -> Webhook | None:
+    '''
+    Returns the guilds webhook or None if the guild has not been setup.\n
+    Built from the saved url on the discord session without fetching it, call invalidateWebhook if it was deleted.\n
+    Rebuilt if the session it was bound to has since been closed or replaced.
+    '''
+    session = await webhookClient.getSession()
+    webhook = _webhooks.get(guild.id)
+
+    if webhook is not None and webhook.session is session:
+        return webhook
+
     guild_data = getGuildData(guild)
 
-    webhook_url = guild_data["webhookurl"]
+    if not guild_data or not guild_data.get("webhookurl"):
+        return None
+
+    webhook = Webhook.from_url(url = guild_data["webhookurl"], session = session)
+    _webhooks[guild.id] = webhook
+
+    return webhook
+
+
+def invalidateWebhook(guild: discord.Guild) -> None:
+    _webhooks.pop(guild.id, None)
 
-    webhook, session = await checkWebhook(webhook_url)
 
-    return webhook, session
+async def closeWebhooks() -> None:
+    '''
+    Drops every cached webhook and closes the discord session they were bound to.
+    '''
+    _webhooks.clear()
+    await webhookClient.close()
 
 
-async def checkWebhook(webhookUrl) -> tuple[Webhook, aiohttp.ClientSession] | None:
+async def checkWebhook(webhookUrl) -> Webhook | None:
     # Check if webhook is valid
     try:
-        session = aiohttp.ClientSession()
-        
-        webhook : Webhook = Webhook.from_url(url = webhookUrl, session = session)
-        webhook = await webhook.fetch()
-        
-        if not webhook:
-            raise ValueError
-
-        return webhook, session
-
-    except ValueError as e:
-        #add logging here
-        print(f"INVALID URL: {e}")
+        webhook : Webhook = Webhook.from_url(url = webhookUrl, session = await webhookClient.getSession())
+        return await webhook.fetch()
+
+    except (ValueError, discord.NotFound) as e:
+        log.warning("Invalid webhook url: %s", e)
         return
 
 
+async def getUserThread(guild: discord.Guild, user: discord.User) -> discord.Thread | None:
+    '''
+    Returns the users thread in the guilds forum channel, creating it if needed.\n
+    Returns None if the guild has not been setup.
+    '''
+    thread = _threads.get((guild.id, user.id))
+
+    if thread is not None:
+        return thread
+
+    guild_data = getGuildData(guild)
+
+    if not guild_data or not guild_data.get("forumid"):
+        return None
+
+    forum_id = int(guild_data["forumid"])
+
+    forum_channel : discord.ForumChannel = guild.get_channel(forum_id) or await guild.fetch_channel(forum_id)
+
+    name = f"{user.name}'s Space"
+
+    thread = next((thread for thread in forum_channel.threads if thread.name == name), None)
+
+    if thread is None:
+        thread, msg = await forum_channel.create_thread(
+            name = name, 
+            content = f"Thread created for {user.name}",
+        )
+
+        await thread.add_user(user)
+
+    _threads[(guild.id, user.id)] = thread
+
+    return thread
+
+
+def invalidateThread(thread: discord.abc.Snowflake) -> None:
+    for key in [key for key, cached in _threads.items() if cached.id == thread.id]:
+        del _threads[key]
+
+
+def invalidateGuild(guild: discord.Guild) -> None:
+    '''
+    Drops the cached webhook and threads of guild, used when its setup changes.
+    '''
+    invalidateWebhook(guild)
+
+    for key in [key for key in _threads if key[0] == guild.id]:
+        del _threads[key]
+
+
+async def sendWebhook(guild: discord.Guild, thread: discord.abc.Snowflake, **kwargs) -> None:
+    '''
+    Sends kwargs through the guilds webhook to thread, dropping cached entries discord no longer knows.
+    '''
+    webhook = await getWebhook(guild)
+
+    if webhook is None:
+        raise ValueError(f"No webhook setup for guild {guild.id}")
+
+    try:
+        await webhook.send(thread = thread, **kwargs)
+
+    except discord.NotFound as e:
+        if e.code == UNKNOWN_WEBHOOK:
+            invalidateWebhook(guild)
+
+        elif e.code == UNKNOWN_CHANNEL:
+            invalidateThread(thread)
+
+        raise
+
+
 # Guild data functions (Used for setup of bot)
-def getGuildData(guild: discord.Guild) -> dict | None:
+GUILD_CONFIG_PATH = "discord_bot/bot_config.json"
+GUILD_CONFIG_FLUSH_DELAY = 2 # seconds, changes made within this are written together
+
+class GuildConfig():
     '''
-    Returns webhook str or none if no data found.\n
-    Keys should be "webhook" and "forumchannel".
+    Guild setup data read from bot_config.json once and served from memory.\n
+    Changes are written back after a short delay by replacing the file so it is never left half written.
     '''
-    with open("discord_bot/bot_config.json") as config:
-        json_config: dict = json.load(config)
 
-        if str(guild.id) not in json_config["guilds"].keys():
-            return None
+    def __init__(self, path: str = GUILD_CONFIG_PATH, flushDelay: float = GUILD_CONFIG_FLUSH_DELAY) -> None:
+        self.path = path
+        self.flushDelay = flushDelay
+
+        self._config: dict = None
+        self._dirty = False
+        self._flushHandle: asyncio.TimerHandle = None
+        self._flushTask: asyncio.Task = None
+        self._lock: asyncio.Lock = None
 
-        return json_config["guilds"][str(guild.id)]
 
+    def _load(self) -> dict:
+        if self._config is None:
+            try:
+                with open(self.path) as config:
+                    self._config = json.load(config)
 
-def addGuildData(guild: discord.Guild, webhook: str = None, forumchannel: str = None ) -> None:
+            except FileNotFoundError:
+                self._config = {}
+
+            self._config.setdefault("guilds", {})
+
+        return self._config
+
+
+    def get(self, guildId: int) -> dict | None:
+        return self._load()["guilds"].get(str(guildId))
+
+
+    def update(self, guildId: int, **fields) -> dict:
+        '''
+        Sets fields on the guilds entry, creating it if needed, and returns the entry.
+        '''
+        guilds = self._load()["guilds"]
+
+        entry = dict(guilds.get(str(guildId)) or {})
+        entry.update(fields)
+
+        guilds[str(guildId)] = entry # Replaced rather than mutated so returned entries are not changed underneath callers
+
+        self._dirty = True
+        self._scheduleFlush()
+
+        return entry
+
+
+    def __len__(self) -> int:
+        return len(self._load()["guilds"])
+
+
+    def _scheduleFlush(self) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+
+        except RuntimeError: # Not running in the bot, write straight away
+            data = self._snapshot()
+
+            try:
+                self._write(data)
+
+            except BaseException:
+                self._dirty = True
+                raise
+
+            return
+
+        if self._flushHandle is None:
+            self._flushHandle = loop.call_later(self.flushDelay, self._startFlush)
+
+
+    def _startFlush(self) -> None:
+        self._flushHandle = None
+
+        # Kept so the write is not garbage collected part way and can be waited on at shutdown
+        self._flushTask = asyncio.create_task(self._flushLater())
+
+
+    async def _flushLater(self) -> None:
+        try:
+            await self.flush()
+
+        except Exception: # Still dirty so the next change tries again
+            log.exception("Writing guild config failed")
+
+
+    def _snapshot(self) -> str:
+        '''
+        Serializes the config and marks it clean, must run on the loop so update never changes it part way.
+        '''
+        self._dirty = False
+
+        return json.dumps(self._config, indent = 4)
+
+
+    async def flush(self) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock: # One write at a time, later changes are picked up by the next flush
+            if not self._dirty:
+                return
+
+            data = self._snapshot()
+
+            try:
+                await asyncio.to_thread(self._write, data) # Only the finished string is handed to the thread
+
+            except BaseException:
+                self._dirty = True
+                raise
+
+
+    def _write(self, data: str) -> None:
+        # Written next to the real file so os.replace stays on the same filesystem
+        directory, name = os.path.split(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix = f".{name}.", dir = directory)
+
+        try:
+            with os.fdopen(fd, "w") as tmp:
+                tmp.write(data)
+                tmp.flush()
+                os.fsync(tmp.fileno())
+
+            if os.path.exists(self.path):
+                os.chmod(tmp_path, os.stat(self.path).st_mode) # mkstemp creates files only the owner can read
+
+            os.replace(tmp_path, self.path)
+
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+    async def close(self) -> None:
+        if self._flushHandle is not None:
+            self._flushHandle.cancel()
+            self._flushHandle = None
+
+        if self._flushTask is not None:
+            await asyncio.gather(self._flushTask, return_exceptions = True)
+            self._flushTask = None
+
+        await self.flush()
+
+
+guildConfig = GuildConfig()
+
+
+def getGuildData(guild: discord.Guild) -> dict | None:
     '''
-    Updates local file and returns updated dict.
+    Returns the guilds setup data or None if the guild has not been setup.\n
+    Keys are "webhookurl" and "forumid".
     '''
-    with open("discord_bot/bot_config.json", "r+") as config:
-        json_config = json.load(config)
+    return guildConfig.get(guild.id)
 
-        cur_data = getGuildData(guild)
 
-        # Make sure not to overwrite other entries
-        new_forum = forumchannel if forumchannel else cur_data["forumid"]   
-        new_webhook = webhook if webhook else cur_data["webhookurl"]
+def addGuildData(guild: discord.Guild, webhook: str = None, forumchannel: int = None ) -> dict:
+    '''
+    Updates the guilds setup data and returns the updated dict, fields left as None are kept.
+    '''
+    fields = {}
 
-        data_obj = {
-            "forumid": new_forum,
-            "webhookurl": new_webhook
-        }
+    if forumchannel:
+        fields["forumid"] = forumchannel
 
-        json_config["guilds"][str(guild.id)] = data_obj
+    if webhook:
+        fields["webhookurl"] = webhook
 
-    with open("discord_bot/bot_config.json", "w") as config:
-        json.dump(json_config, config)
+    return guildConfig.update(guild.id, **fields)
@@ -1,27 +1,105 @@
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord_bot.cogs import GoodwillCommands
+from discord_bot.scheduler import watchScheduler
+from discord_bot.watch_store import watchStore
+from discord_bot import TEMPUSERDATA
+from discord_bot.base import guildConfig, closeWebhooks
+from discord_bot.notifications import notificationQueue
+from discord_bot.watchdog import watchdog
+from discord_bot.logs import setupLogging, stopLogging
+
+from goodwill.client import client as httpClient
+from goodwill import metrics
+from goodwill import db
+from goodwill.category_sync import syncCategories
+from goodwill.category_search import getMatcher
 
 import logging
-import logging.handlers
 import discord
+import datetime
 import os
 
+log = logging.getLogger(__name__)
+
+# Daily category refresh, kept outside of peak hours
+CATEGORY_SYNC_TIME = datetime.time(hour = 10, tzinfo = datetime.timezone.utc)
+
+# Off unless CATEGORY_SYNC=1, category_sync.CATEGORY_URL has not been confirmed against the live api yet
+CATEGORY_SYNC_ENABLED = os.environ.get("CATEGORY_SYNC") == "1"
+
 class Bot(commands.Bot):
     def __init__(self):
         intents = discord.Intents.default() #TODO figure out how intents works
 
         super().__init__(command_prefix = '!', intents = intents)
+
+        self.metricsRunner = None
     
     async def on_ready(self):
 
-        print(f'We have logged in as {self.user} (ID : {self.user.id})')
+        log.info("Logged in as %s", self.user, extra = {"id": self.user.id})
     
     async def setup_hook(self):
-        
+        # Started first so stalls during startup are reported too
+        watchdog.start()
+
+        # Open the shared goodwill session before any commands can run
+        await httpClient.start()
+
+        # Category lookups are served from memory after this
+        index = await db.refreshIndexAsync()
+        getMatcher(index) # Build autocomplete up front so the first keystroke is not slow
+
+        # Watches from before the restart, their first polls are staggered by the scheduler
+        restored = await TEMPUSERDATA.restoreWatches(watchStore)
+        log.info("Restored watched listings", extra = {"watches": restored})
+
         await self.add_cog(GoodwillCommands(bot))
 
         await self.tree.sync()
 
+        if CATEGORY_SYNC_ENABLED:
+            self.categorySync.start()
+
+        try:
+            self.metricsRunner = await metrics.startServer()
+
+        except OSError as e: # Port already in use, the bot still works without it
+            log.warning("Metrics server not started: %r", e)
+
+    @tasks.loop(time = CATEGORY_SYNC_TIME)
+    async def categorySync(self):
+        try:
+            report = await syncCategories()
+
+        except Exception: # Any error escaping would stop the loop for good
+            log.exception("Category sync failed")
+            return
+
+        log.info(
+            "Category sync finished", 
+            extra = {
+                "fetched": report.fetched, "added": report.added, "changed": report.changed, 
+                "removed": report.removed, "seconds": round(report.seconds, 2)
+            }
+        )
+
+    async def close(self):
+        self.categorySync.cancel()
+        await watchScheduler.stop()
+        await notificationQueue.close()
+        await guildConfig.close()
+
+        await super().close()
+
+        if self.metricsRunner is not None:
+            await self.metricsRunner.cleanup()
+
+        await httpClient.close()
+        await closeWebhooks()
+
+        await watchdog.stop()
+
 
 bot = Bot()
 
@@ -29,19 +107,11 @@ bot = Bot()
 def run():
     TOKEN = os.environ["DISCORDTOKEN"]
 
-    logger = logging.getLogger('discord')
-    logger.setLevel(logging.INFO)
-
-    handler = logging.handlers.RotatingFileHandler(
-        filename='discord.log',
-        encoding='utf-8',
-        maxBytes=32 * 1024 * 1024,  # 32 MiB
-        backupCount=5,  # Rotate through 5 files
-    )
+    # File and console writes happen on the listeners thread, never on the event loop
+    listener = setupLogging()
 
-    dt_fmt = '%Y-%m-%d %H:%M:%S'
-    formatter = logging.Formatter('[{asctime}] [{levelname:<8}] {name}: {message}', dt_fmt, style='{')
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+    try:
+        bot.run(TOKEN, log_handler = None) # Logging is already setup
 
-    bot.run(TOKEN)
\ No newline at end of file
+    finally:
+        stopLogging(listener)
@@ -2,15 +2,26 @@ from discord.ext import commands
 import discord
 from discord import app_commands, Embed
 from math import ceil
+from time import perf_counter
 
 from goodwill.dataclasses import IdSearch, KeywordSearch, LoginParams, Login, PlaceBidParams, PlaceBid
-from goodwill.db import getQuery
+from goodwill.base import calculateShipping
+from goodwill.db import getQueryAsync
+from goodwill.category_search import searchCategories
+from goodwill.ratelimit import INTERACTIVE
+from goodwill import metrics
 
 from discord_bot import TEMPUSERDATA
 from discord_bot import Embeds
-from discord_bot.base import isAdmin, addGuildData, getWebhook
+from discord_bot.base import isAdmin, addGuildData, getUserThread, invalidateGuild
 from discord_bot.views import KeywordResults
 from discord_bot.reminders import WatchListing
+from discord_bot.scheduler import watchScheduler, POLL_LAG
+from discord_bot.notifications import notificationQueue
+
+MAX_SEARCH_IDS = 50
+
+COMMAND_LATENCY = metrics.registry.histogram("command_seconds", "Slash command time from check to completion", ("command", "result"))
 
 async def forum_channels(interaction: discord.Interaction, current: str):
     channels = interaction.guild.channels
@@ -21,11 +32,36 @@ async def forum_channels(interaction: discord.Interaction, current: str):
     ]
 
 
+async def category_autocomplete(interaction: discord.Interaction, current: str):
+    return [
+        app_commands.Choice(name = label, value = str(category.categoryId))
+        for category, label in searchCategories(current)
+    ]
+
+
 class GoodwillCommands(commands.Cog):
     
     def __init__(self, bot: commands.Bot):
         self.bot = bot
 
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        # Runs before every command in this cog, the start time is read back on completion
+        interaction.extras["started"] = perf_counter()
+        return True
+
+    def _recordCommand(self, interaction: discord.Interaction, result: str) -> None:
+        started = interaction.extras.get("started")
+
+        if started is not None and interaction.command is not None:
+            COMMAND_LATENCY.observe(perf_counter() - started, command = interaction.command.qualified_name, result = result)
+
+    @commands.Cog.listener()
+    async def on_app_command_completion(self, interaction: discord.Interaction, command):
+        self._recordCommand(interaction, "ok")
+
+    async def cog_app_command_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        self._recordCommand(interaction, "error")
+
     search_group = app_commands.Group(name = "search", description = "Commands used to search goodwill")
 
     @search_group.command(name = "all", description = "Search all listings using selected category")
@@ -35,7 +71,7 @@ class GoodwillCommands(commands.Cog):
         category = userdata.category if userdata else None
 
         if category:
-            category = getQuery(cat_id = category)
+            category = await getQueryAsync(cat_id = category)
 
             searchParams = KeywordSearch.initParams(
                 paramType = 1,
@@ -68,7 +104,7 @@ class GoodwillCommands(commands.Cog):
         category = userdata.category if userdata else None
 
         if category:
-            category = getQuery(cat_id = category)
+            category = await getQueryAsync(cat_id = category)
             categoryName = category.categoryName
 
             searchParams = KeywordSearch.initParams(
@@ -106,29 +142,34 @@ class GoodwillCommands(commands.Cog):
         )
 
     @search_group.command(name = "id", description='Search by listing IDs comma seperated')
-    async def searchid(self, interaction: discord.Interaction, ids: str): #TODO add Id length checking
-        if ',' in ids:
-            valid_ids = [id.strip() for id in ids.split(",") if id.strip().isnumeric()]
-            listings = [await IdSearch(itemId=validId).makeRequest() for validId in valid_ids]
-            listings = [listing for listing in listings if listing] # Make sure listing is not none
+    async def searchid(self, interaction: discord.Interaction, ids: str):
+        ids = [id.strip() for id in ids.split(",") if id.strip()]
 
-            listings = listings if len(listings) > 0 else None
+        if len(ids) > MAX_SEARCH_IDS:
+            return await interaction.response.send_message(f"Can only search up to {MAX_SEARCH_IDS} ids at once.", ephemeral = True)
 
-        else:
-            listingId = ids
-            listing = await IdSearch(listingId).makeRequest()
+        invalid_ids = [id for id in ids if not id.isnumeric()]
+        valid_ids = [id for id in ids if id.isnumeric()]
+
+        if len(valid_ids) == 0:
+            return await interaction.response.send_message("No valid ids given.", ephemeral = True)
+
+        # Lookups can take longer than the interaction deadline
+        await interaction.response.defer()
 
-            listings = [listing] if listing else None # Make sure listing is not none
+        results = await IdSearch.many(valid_ids)
 
-        if listings is None:
-            raise ValueError("Invalid Ids or other error")
+        embeds = [Embeds.listing(result.listing) for result in results if result.listing]
+        failed_ids = invalid_ids + [str(result.itemId) for result in results if result.error]
 
-        embeds = []
+        content = f"Could not find listings for: {', '.join(failed_ids)}" if failed_ids else None
 
-        for listing in listings:
-            embeds.append(Embeds.listing(listing))
+        if len(embeds) == 0:
+            return await interaction.followup.send(content)
 
-        await interaction.response.send_message(embeds = embeds)
+        # Discord allows up to 10 embeds per message so overflow is sent as extra messages
+        for i in range(0, len(embeds), 10):
+            await interaction.followup.send(content = content if i == 0 else None, embeds = embeds[i:i+10])
 
         
     @isAdmin() 
@@ -143,6 +184,7 @@ class GoodwillCommands(commands.Cog):
         webhook = await channel.create_webhook(name = "Goodwill Fourm", reason = "Goodwill bot setup")
 
         addGuildData(interaction.guild, webhook = webhook.url, forumchannel = channel.id)
+        invalidateGuild(interaction.guild)
 
         return await interaction.response.send_message(f"Set forum channel to {channel.name}", ephemeral = True)
 
@@ -150,28 +192,14 @@ class GoodwillCommands(commands.Cog):
     @app_commands.command(name = "watchlisting", description='Create a webhook to send reminders')
     async def watchlisting(self, interaction: discord.Interaction, id: str):
 
-        webhook, session = await getWebhook(interaction.guild)
+        new_thread = await getUserThread(interaction.guild, interaction.user)
 
-        forum_channel : discord.ForumChannel = await interaction.guild.fetch_channel(webhook.channel_id)
+        if new_thread is None:
+            return await interaction.response.send_message("No forum channel has been set, use /setforum first", ephemeral = True)
 
-        existing_threads = [thread for thread in forum_channel.threads if thread.name == f"{interaction.user.name}'s Space"]
+        listing = await WatchListing.requestListing(itemId = id, priority = INTERACTIVE)
 
-        if len(existing_threads) > 0:
-            new_thread = existing_threads[0]
-
-        else:
-            new_thread, msg = await forum_channel.create_thread(
-                name = f"{interaction.user.name}'s Space", 
-                content = f"Thread created for {interaction.user.name}",
-            )
-
-            await new_thread.add_user(interaction.user)
-
-        await session.close()
-
-        listing = await WatchListing.requestListing(itemId = id)
-
-        TEMPUSERDATA.addWatchListing(user = interaction.user, listing = listing)
+        TEMPUSERDATA.addWatchListing(user = interaction.user, listing = listing, guild = interaction.guild, thread = new_thread)
 
         await interaction.response.send_message(f'Create a webhook to send reminders for {id}', ephemeral = True)
 
@@ -184,25 +212,22 @@ class GoodwillCommands(commands.Cog):
 
 
     @app_commands.command(name = "select-category", description = "Set categories to search") 
+    @app_commands.autocomplete(category_id = category_autocomplete)
     async def add(self, interaction: discord.Interaction, category_id: str):
-        category = getQuery(cat_id = category_id)
+        category = await getQueryAsync(cat_id = category_id)
 
         if not category:
-            await interaction.response.send_message(f"Category not found for id: {category_id}", delete_after = 10)
+            return await interaction.response.send_message(f"Category not found for id: {category_id}", delete_after = 10)
 
-        userData = TEMPUSERDATA.getUser(interaction.user) 
-        
-        if userData:
-            userData.category = category.categoryId
-
-        else:
-            TEMPUSERDATA.addUser(interaction.user, category.categoryId)
+        TEMPUSERDATA.setCategory(interaction.user, category.categoryId)
 
         await interaction.response.send_message(f"Category set to {category.categoryName}", delete_after = 10)
 
     @app_commands.command(name = "check-category", description = "View selected category")
     async def checkCategory(self, interaction: discord.Interaction):
-        cur_category = TEMPUSERDATA.getUser(interaction.user).category
+        userData = TEMPUSERDATA.getUser(interaction.user)
+
+        cur_category = userData.category if userData else None
 
         if cur_category:
             return await interaction.response.send_message(f"Current category is set to {cur_category}.")
@@ -211,11 +236,13 @@ class GoodwillCommands(commands.Cog):
 
     @app_commands.command(name = "estimate-shipping", description = "Estimate shipping to zip code")
     async def estimate_shipping(self, interaction: discord.Interaction, id: int, zipcode: str):
-        listing = await IdSearch(id).makeRequest()
+        try:
+            quote = await calculateShipping(id, zipcode)
 
-        shipping_data = await listing.calculateShipping(zipcode)
+        except ValueError as e:
+            return await interaction.response.send_message(f"Error: {e}", ephemeral = True)
 
-        embed = Embed(title = "Estimated Shipping and Handling:", description = shipping_data)
+        embed = Embeds.shipping(quote)
 
         return await interaction.response.send_message(embed = embed, ephemeral = True)
 
@@ -238,6 +265,40 @@ class GoodwillCommands(commands.Cog):
         return await interaction.response.send_message(embed = await Embeds.bid_response(response.getResult(), listing))
 
 
+    @isAdmin()
+    @app_commands.command(name = "stats", description = "Show request, watch and command stats")
+    async def stats(self, interaction: discord.Interaction):
+        def latency(histogram: metrics.Histogram, label: str) -> list[str]:
+            return [
+                f"{labels[label]}: {histogram.count(**labels)} | p50 {histogram.quantile(0.5, **labels):.2f}s | p95 {histogram.quantile(0.95, **labels):.2f}s"
+                for labels in histogram.series()
+            ]
+
+        watches = watchScheduler.stats()
+        notifications = notificationQueue.stats()
+
+        embed = Embeds.stats({
+            "Goodwill Requests": latency(metrics.HTTP_LATENCY, "endpoint"),
+            "Commands": latency(COMMAND_LATENCY, "command"),
+            "Watches": [
+                f"{watches.watches} listings, {watches.subscriptions} subscriptions",
+                f"{watches.polls} polls, {watches.failures} failed",
+                f"Poll lag p50 {POLL_LAG.quantile(0.5):.2f}s | p95 {POLL_LAG.quantile(0.95):.2f}s",
+                f"Missed final prices {watches.missedFinals}/{watches.finals} ({watches.missedRate:.1%})",
+            ],
+            "Notifications": [
+                f"{notifications.pending} pending in {notifications.threads} threads",
+                f"{notifications.sent} sent in {notifications.messages} messages, {notifications.dropped} dropped",
+            ],
+            "Caches": [
+                f"{name}: {stats.hitRate:.1%} hit rate, {stats.size} entries"
+                for name, stats in metrics.cacheStats().items()
+            ],
+        })
+
+        await interaction.response.send_message(embed = embed, ephemeral = True)
+
+
     @isAdmin()
     @app_commands.command(name = "purge", description = "purge messages")
     async def purge(self, interaction: discord.Interaction, num_msgs:int):
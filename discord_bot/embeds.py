@@ -1,6 +1,7 @@
 import discord
 from discord import Embed
-from goodwill.dataclasses import Listing, IdSearch
+from goodwill.dataclasses import Listing, CompactListing, IdSearch
+from goodwill.shipping import ShippingQuote
 
 
 async def bid_response(response: bool, listing: Listing):
@@ -19,7 +20,7 @@ async def bid_response(response: bool, listing: Listing):
 
 
 def page(
-        keywords, category, listings: list[Listing], 
+        keywords, category, listings: list[Listing | CompactListing], 
         page: int, total_pages: int, searchType: int = 0
     ) -> Embed:
     title_str = f'Keyword Search: "{keywords}"' if searchType == 0 else f'Id Search: {keywords}'
@@ -51,4 +52,40 @@ def listing(listing: Listing) -> Embed:
         url = f"https://shopgoodwillimages.azureedge.net/production/{listing.imageUrlString.split(';')[0]}"
         embed.set_image(url = url) 
     
-    return embed
\ No newline at end of file
+    return embed
+
+
+def shipping(quote: ShippingQuote) -> Embed:
+    embed = Embed(title = "Estimated Shipping and Handling:", colour=discord.Colour.blue())
+
+    if quote.total is None:
+        # Response could not be parsed into fields so show it as is
+        embed.description = quote.toText()
+        return embed
+
+    if quote.address:
+        embed.description = quote.address
+
+    if quote.carrier:
+        embed.add_field(name = "Carrier", value = quote.carrier, inline = True)
+
+    if quote.shipping is not None:
+        embed.add_field(name = "Shipping", value = f"${quote.shipping:.2f}", inline = True)
+
+    if quote.handling is not None:
+        embed.add_field(name = "Handling", value = f"${quote.handling:.2f}", inline = True)
+
+    embed.add_field(name = "Total", value = f"${quote.total:.2f}", inline = False)
+
+    embed.set_footer(text = f"Item {quote.itemId} to {quote.zipCode}")
+
+    return embed
+
+
+def stats(sections: dict[str, list[str]]) -> Embed:
+    embed = Embed(title = "Bot Stats", colour=discord.Colour.blue())
+
+    for name, lines in sections.items():
+        embed.add_field(name = name, value = "\n".join(lines)[:1024] or "No data", inline = False)
+
+    return embed
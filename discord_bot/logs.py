@@ -0,0 +1,147 @@
+import logging
+import logging.handlers
+import queue
+
+from goodwill.metrics import registry
+
+LOG_FILE = "discord.log"
+LOG_FORMAT = '[{asctime}] [{levelname:<8}] {name}: {message}'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Records waiting for the writer thread, past this new records are dropped rather than blocking
+QUEUE_SIZE = 100_000
+
+# Loggers which log every poll or notification, their info and debug records are sampled
+SAMPLED_LOGGERS = ("discord_bot.scheduler", "discord_bot.notifications")
+SAMPLE_EVERY = 100
+
+# Attributes every LogRecord has, anything else was passed through extra and is appended as key=value
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+class KeyValueFormatter(logging.Formatter):
+    '''
+    Formats records as usual then appends fields given through extra ie. log.info("Polled", extra = {"itemId": 1}).
+    '''
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = super().format(record)
+
+        fields = " ".join(f"{key}={value}" for key, value in vars(record).items() if key not in _RECORD_ATTRS)
+
+        if not fields:
+            return message
+
+        # Keep tracebacks after the fields
+        first, sep, rest = message.partition("\n")
+        return f"{first} {fields}{sep}{rest}"
+
+
+class SamplingFilter(logging.Filter):
+    '''
+    Keeps the first and then every nth record of each message below maxLevel, warnings and errors always pass.\n
+    Kept records get a sampled field so it is clear they stand for more.
+    '''
+
+    def __init__(self, every: int = SAMPLE_EVERY, maxLevel: int = logging.INFO) -> None:
+        super().__init__()
+
+        self.every = every
+        self.maxLevel = maxLevel
+        self._counts: dict[tuple[str, str], int] = {}
+
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.maxLevel:
+            return True
+
+        key = (record.name, str(record.msg)) # The unformatted message so every poll of the same kind is counted together
+        count = self._counts.get(key, 0)
+        self._counts[key] = count + 1
+
+        if count % self.every != 0:
+            return False
+
+        record.sampled = f"1/{self.every}"
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    '''
+    QueueHandler which drops records when the queue is full so logging never waits on the writer thread.
+    '''
+
+    def __init__(self, queue: queue.Queue) -> None:
+        super().__init__(queue)
+        self.dropped = 0
+
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+
+        except queue.Full:
+            self.dropped += 1
+
+
+def droppedRecords() -> int:
+    '''
+    Records dropped so far by the queue handlers on the root logger.
+    '''
+    return sum(handler.dropped for handler in logging.getLogger().handlers if isinstance(handler, DroppingQueueHandler))
+
+
+def setupLogging(level: int = logging.INFO, filename: str = LOG_FILE, console: bool = True) -> logging.handlers.QueueListener:
+    '''
+    Routes every logger through a queue to a background thread which does the file and console writes.\n
+    Returns the started listener, pass it to stopLogging at shutdown to write out what is left.
+    '''
+    formatter = KeyValueFormatter(LOG_FORMAT, DATE_FORMAT, style='{')
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        filename=filename,
+        encoding='utf-8',
+        maxBytes=32 * 1024 * 1024,  # 32 MiB
+        backupCount=5,  # Rotate through 5 files
+    )
+    handlers = [file_handler]
+
+    if console:
+        handlers.append(logging.StreamHandler())
+
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    records = queue.Queue(QUEUE_SIZE)
+
+    root = logging.getLogger()
+    root.setLevel(logging.WARNING) # Only warnings from third party libraries
+    root.addHandler(DroppingQueueHandler(records))
+
+    for name in ("discord", "goodwill", "discord_bot"):
+        logging.getLogger(name).setLevel(level)
+
+    for name in SAMPLED_LOGGERS:
+        logging.getLogger(name).addFilter(SamplingFilter())
+
+    listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level = True)
+    listener.start()
+
+    return listener
+
+
+def stopLogging(listener: logging.handlers.QueueListener) -> None:
+    '''
+    Stops listener once everything queued is written, then reports how many records were dropped if any.\n
+    The report goes straight to the listeners handlers since the queue may still have been full.
+    '''
+    listener.stop()
+
+    dropped = droppedRecords()
+
+    if dropped:
+        log = logging.getLogger(__name__)
+        listener.handle(log.makeRecord(log.name, logging.WARNING, __file__, 0, "Dropped %d log records while the log queue was full", (dropped,), None))
+
+
+registry.counter("log_records_dropped_total", "Log records dropped because the log queue was full", func = droppedRecords)
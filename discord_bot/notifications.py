@@ -0,0 +1,257 @@
+import aiohttp
+import asyncio
+import logging
+
+import discord
+
+from dataclasses import dataclass, field
+from time import monotonic
+from typing import Callable
+
+from discord_bot.base import sendWebhook, UNKNOWN_CHANNEL
+from goodwill.base import parseRetryAfter
+from goodwill.ratelimit import RateLimiter, INTERACTIVE, BACKGROUND
+from goodwill.metrics import registry
+
+log = logging.getLogger(__name__)
+
+# Notification priorities, lower values are sent first
+ENDED = 0
+ENDING_SOON = 1
+UPDATE = 2
+
+# Discord allows 10 embeds per message and 6000 characters across them
+MAX_EMBEDS = 10
+MAX_EMBED_CHARS = 6000
+MAX_CONTENT_CHARS = 2000
+
+# Discord limits webhooks to about 5 requests per 2 seconds and channels to 30 messages a minute
+WEBHOOK_RATE = 2.5
+WEBHOOK_BURST = 5
+THREAD_RATE = 0.5
+THREAD_BURST = 5
+
+CLOSE_TIMEOUT = 5 # seconds spent sending what is left when the bot shuts down
+
+
+@dataclass(frozen=True)
+class Notification():
+    priority: int
+    itemId: int
+    embed: discord.Embed
+    content: str = None
+    created: float = field(default_factory = monotonic)
+
+
+@dataclass(frozen=True)
+class NotificationStats():
+    pending: int
+    threads: int
+    messages: int # Messages sent, each can hold several notifications
+    sent: int
+    dropped: int
+
+
+def _limiter(rate: float, burst: int) -> RateLimiter:
+    # Discords limits are fixed so the rate is only lowered on 429s and never raised past its start
+    return RateLimiter(rate = rate, burst = burst, minRate = rate / 4, maxRate = rate)
+
+
+class ThreadQueue():
+    '''
+    Notifications waiting to be sent to one thread, keyed by item so only the latest update for each listing is sent.
+    '''
+
+    def __init__(self, guild: discord.Guild, thread: discord.abc.Snowflake) -> None:
+        self.guild = guild
+        self.thread = thread
+        self.pending: dict[int, Notification] = {}
+        self.limiter = _limiter(THREAD_RATE, THREAD_BURST)
+        self.task: asyncio.Task = None
+
+
+    def add(self, notification: Notification) -> None:
+        current = self.pending.get(notification.itemId)
+
+        # Nothing replaces the ended message of a listing, the final price is already in it
+        if current is not None and current.priority == ENDED:
+            return
+
+        # Newer embed but keep the earlier, more urgent priority
+        if current is not None and current.priority < notification.priority:
+            notification = Notification(current.priority, notification.itemId, notification.embed, current.content, current.created)
+
+        self.pending[notification.itemId] = notification
+
+
+    def priority(self) -> int:
+        return min(notification.priority for notification in self.pending.values())
+
+
+    def take(self) -> list[Notification]:
+        '''
+        Removes and returns the most urgent notifications which fit in one message.
+        '''
+        batch = []
+        chars = 0
+        content = 0
+
+        for notification in sorted(self.pending.values(), key = lambda notification: (notification.priority, notification.created)):
+            size = len(notification.embed)
+            content_size = len(notification.content) + 1 if notification.content else 0
+
+            if batch and (len(batch) == MAX_EMBEDS or chars + size > MAX_EMBED_CHARS or content + content_size > MAX_CONTENT_CHARS):
+                break
+
+            batch.append(notification)
+            chars += size
+            content += content_size
+
+        for notification in batch:
+            del self.pending[notification.itemId]
+
+        return batch
+
+
+class NotificationQueue():
+    '''
+    Sends watch notifications in the background so polling never waits on discord.\n
+    Each thread has its own queue and sender, pending updates for a thread are sent together as one message.\n
+    onThreadGone is called with the thread when discord reports it deleted so it is no longer sent to.
+    '''
+
+    def __init__(self, onThreadGone: Callable[[discord.abc.Snowflake], None] = None) -> None:
+        self.onThreadGone = onThreadGone
+
+        self._threads: dict[tuple[int, int], ThreadQueue] = {}
+        self._webhooks: dict[int, RateLimiter] = {} # Keyed by guild, each guild has one webhook
+
+        self._messages = 0
+        self._sent = 0
+        self._dropped = 0
+
+
+    def enqueue(self, guild: discord.Guild, thread: discord.abc.Snowflake, notification: Notification) -> None:
+        key = (guild.id, thread.id)
+
+        queue = self._threads.get(key)
+
+        if queue is None:
+            queue = self._threads[key] = ThreadQueue(guild, thread)
+
+        queue.add(notification)
+
+        if queue.task is None or queue.task.done():
+            queue.task = asyncio.create_task(self._deliver(key, queue))
+
+
+    async def _deliver(self, key: tuple[int, int], queue: ThreadQueue) -> None:
+        webhook_limiter = self._webhooks.get(queue.guild.id)
+
+        if webhook_limiter is None:
+            webhook_limiter = self._webhooks[queue.guild.id] = _limiter(WEBHOOK_RATE, WEBHOOK_BURST)
+
+        try:
+            while queue.pending:
+                lane = INTERACTIVE if queue.priority() < UPDATE else BACKGROUND
+
+                await queue.limiter.acquire()
+                await webhook_limiter.acquire(lane) # Ended and ending soon messages get the webhooks tokens first
+
+                # Taken after waiting so updates which arrived meanwhile are sent in the same message
+                batch = queue.take()
+
+                await self._send(queue, batch, webhook_limiter)
+
+        finally:
+            if not queue.pending and self._threads.get(key) is queue:
+                del self._threads[key]
+
+
+    async def _send(self, queue: ThreadQueue, batch: list[Notification], webhook_limiter: RateLimiter) -> None:
+        content = "\n".join(notification.content for notification in batch if notification.content)
+
+        try:
+            await sendWebhook(
+                queue.guild, queue.thread,
+                content = content or discord.utils.MISSING,
+                embeds = [notification.embed for notification in batch]
+            )
+
+        except discord.HTTPException as e:
+            if e.status == 429:
+                self._retry(queue, batch, webhook_limiter, parseRetryAfter(e.response.headers.get("Retry-After")))
+                return
+
+            if isinstance(e, discord.NotFound): # Thread or webhook is gone so nothing else can be sent either
+                self._dropped += len(queue.pending)
+                queue.pending.clear()
+
+                if e.code == UNKNOWN_CHANNEL and self.onThreadGone is not None:
+                    self.onThreadGone(queue.thread)
+
+            self._dropped += len(batch)
+            log.exception("Sending notifications failed", extra = {"threadId": queue.thread.id})
+            return
+
+        except ValueError: # Guild is no longer setup
+            self._dropped += len(batch) + len(queue.pending)
+            queue.pending.clear()
+            log.exception("Sending notifications failed", extra = {"threadId": queue.thread.id})
+            return
+
+        except (aiohttp.ClientError, asyncio.TimeoutError): # Discord could not be reached, try again once the limiters allow it
+            log.warning("Sending notifications failed, retrying", exc_info = True, extra = {"threadId": queue.thread.id})
+            self._retry(queue, batch, webhook_limiter)
+            return
+
+        queue.limiter.onSuccess()
+        webhook_limiter.onSuccess()
+
+        self._messages += 1
+        self._sent += len(batch)
+
+
+    def _retry(self, queue: ThreadQueue, batch: list[Notification], webhook_limiter: RateLimiter, retryAfter: float = None) -> None:
+        '''
+        Backs off both limiters and puts batch back to be sent again.
+        '''
+        queue.limiter.onThrottle(retryAfter)
+        webhook_limiter.onThrottle(retryAfter)
+
+        for notification in batch:
+            if notification.itemId not in queue.pending: # Keep newer updates that arrived meanwhile
+                queue.pending[notification.itemId] = notification
+
+
+    def stats(self) -> NotificationStats:
+        return NotificationStats(
+            pending = sum(len(queue.pending) for queue in self._threads.values()),
+            threads = len(self._threads),
+            messages = self._messages,
+            sent = self._sent,
+            dropped = self._dropped
+        )
+
+
+    async def close(self, timeout: float = CLOSE_TIMEOUT) -> None:
+        tasks = [queue.task for queue in self._threads.values() if queue.task is not None and not queue.task.done()]
+
+        if not tasks:
+            return
+
+        done, pending = await asyncio.wait(tasks, timeout = timeout)
+
+        for task in pending:
+            task.cancel()
+
+        await asyncio.gather(*pending, return_exceptions = True)
+
+
+notificationQueue = NotificationQueue()
+
+registry.gauge("notification_queue_depth", "Notifications waiting to be sent", func = lambda : notificationQueue.stats().pending)
+registry.gauge("notification_threads", "Threads with notifications waiting", func = lambda : notificationQueue.stats().threads)
+registry.counter("notification_messages_total", "Notification messages sent", func = lambda : notificationQueue.stats().messages)
+registry.counter("notification_sent_total", "Notifications sent", func = lambda : notificationQueue.stats().sent)
+registry.counter("notification_dropped_total", "Notifications dropped", func = lambda : notificationQueue.stats().dropped)
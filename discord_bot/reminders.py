@@ -1,65 +1,135 @@
 from dataclasses import dataclass
-from datetime import timedelta, datetime
+from datetime import timedelta, datetime, timezone
 
-import aiohttp, asyncio
-from discord import Thread, User, Guild
+import asyncio
+import sys
+import time
+from collections import OrderedDict
+from discord import Thread, User, Guild, Object
 
 from discord_bot import Embeds
-from discord_bot.base import getWebhook
+from discord_bot import notifications
+from discord_bot.notifications import Notification, notificationQueue
+from discord_bot.scheduler import watchScheduler
+from discord_bot.watch_store import WatchStore
 
+from goodwill.base import getItemDetail
+from goodwill.ratelimit import BACKGROUND
 from goodwill.dataclasses import SimpleListing
 
+# Polls happen every POLL_RATIO of the remaining time, ie. 1 hour left -> every 6 minutes
+POLL_RATIO = 0.1
+MIN_POLL_INTERVAL = 30 # seconds
+MAX_POLL_INTERVAL = 7200
+
+# The last poll is made this long after the end so the winning price is final
+FINAL_POLL_DELAY = 15 # seconds
+
+# Restored watches are polled at least this far apart so a restart does not request every item at once
+# With many watches the gap shrinks so all are spread within MIN_POLL_INTERVAL and none is pushed past its end
+RESTORE_STAGGER = 0.05 # seconds
+RESTORE_CHUNK = 1000 # Watches restored between yields to the event loop
+
+# Users without watches are dropped after this long without using a command
+USER_IDLE_TTL = 3600 # seconds
+MAX_USERS = 10000 # Past this the least recently used users without watches are dropped early
+EVICT_INTERVAL = 60 # seconds
+
+# Updates this close to the end are sent before other updates
+ENDING_SOON_WINDOW = timedelta(minutes = 15)
+
+# endTime is trusted unless it disagrees with remainingTime by more than this, ie. if the timezone was wrong
+END_TIME_TOLERANCE = timedelta(minutes = 5)
+
 class WatchListing():
 
     def __init__(self, listing: SimpleListing) -> None:
         self.listing = listing
+        self.prevPoll = datetime.now(timezone.utc)
         self.remainingTime = listing.remainingTime
+        self.endsAt = self.anchorEnd(listing, self.prevPoll)
         self.pollingInterval = self.getInterval()
 
 
-    async def updateWatchListing(self, guild, thread): 
-        webhook, session = await getWebhook(guild)
+    @staticmethod
+    def anchorEnd(listing: SimpleListing, now: datetime, previous: datetime = None) -> datetime:
+        '''
+        Returns the absolute end of listing, falling back to now + remainingTime if endTime is missing or off.\n
+        Once no time is left the end is kept at previous, the last known end, as now would only be when it was polled.
+        '''
+        if listing.remainingTime <= timedelta(0):
+            return previous or listing.endsAt or now
 
-        embed = Embeds.listing(listing = self.listing)
+        estimate = now + listing.remainingTime
 
-        await webhook.send(embed= embed, thread = thread)
+        if listing.endsAt is None or abs(listing.endsAt - estimate) > END_TIME_TOLERANCE:
+            return estimate
 
-        await session.close()
+        # Time is still left past the given end so the auction was extended
+        if listing.endsAt <= now:
+            return estimate
 
+        return listing.endsAt
 
-    async def terminateWatchListing(self, guild, thread):
-        webhook, session = await getWebhook(guild)
 
+    def updateWatchListing(self, guild, thread): 
         embed = Embeds.listing(listing = self.listing)
 
-        await webhook.send(embed= embed, thread = thread)
-        await webhook.send(content = f"Listing has ended, winning bid is: {self.listing.currentPrice}")
+        ending_soon = self.endsAt - datetime.now(timezone.utc) <= ENDING_SOON_WINDOW
+
+        notificationQueue.enqueue(guild, thread, Notification(
+            priority = notifications.ENDING_SOON if ending_soon else notifications.UPDATE,
+            itemId = self.listing.itemId,
+            embed = embed
+        ))
+
 
-        await session.close()
+    def terminateWatchListing(self, guild, thread):
+        embed = Embeds.listing(listing = self.listing)
+
+        notificationQueue.enqueue(guild, thread, Notification(
+            priority = notifications.ENDED,
+            itemId = self.listing.itemId,
+            embed = embed,
+            content = f"Listing has ended, winning bid is: {self.listing.currentPrice}"
+        ))
     
 
-    def getInterval(self) -> int:
-        """
-        Calculates an interval for checking a listing based on its remaining time.
-        """
-        # Define a dictionary mapping time ranges (in seconds) to corresponding intervals
-        time_ranges = {
-            86400: 7200,  # One day: 2 hours in seconds
-            43200: 3600,  # Half day: 1 hour in seconds
-            3600: 1800,  # One hour: 30 minutes in seconds
-            1800: 900,    # Thirty minutes: 15 minutes in seconds
-            900: 60,     # Fifteen minutes: 1 minute in seconds
-            0: 30         # Five minutes or less: 30 seconds
-        }
-
-        # Ensure remaining time is non-negative (handle negative values if necessary)
-        remaining_time = max(0, self.listing.remainingTime.total_seconds())
-
-        # Find the first time range in the dictionary that matches or exceeds the remaining time
-        matching_range = next((r for r, interval in time_ranges.items() if remaining_time >= r), 0)
-
-        # Return the corresponding interval
-        return time_ranges[matching_range]
+    def getInterval(self, now: datetime = None) -> float:
+        '''
+        Calculates an interval for checking a listing, shrinking smoothly as the end approaches.
+        '''
+        now = now or datetime.now(timezone.utc)
+
+        remaining = (self.endsAt - now).total_seconds()
+
+        return min(MAX_POLL_INTERVAL, max(MIN_POLL_INTERVAL, remaining * POLL_RATIO))
+
+
+    def nextPoll(self, now: datetime = None) -> datetime:
+        '''
+        Returns when the listing should next be checked, never later than the final poll just after it ends.
+        '''
+        now = now or datetime.now(timezone.utc)
+
+        final_poll = self.endsAt + timedelta(seconds = FINAL_POLL_DELAY)
+
+        # Past the final poll but not ended yet, keep checking without polling back to back
+        if now >= final_poll:
+            return now + timedelta(seconds = MIN_POLL_INTERVAL)
+
+        if now >= self.endsAt:
+            return final_poll
+
+        return min(now + timedelta(seconds = self.getInterval(now)), final_poll)
+
+
+    @property
+    def ended(self) -> bool:
+        '''
+        True once the listing was fetched after its end so currentPrice is the winning price.
+        '''
+        return self.prevPoll >= self.endsAt and self.remainingTime <= timedelta(0)
 
     
     async def checkListing(self) -> bool:
@@ -70,7 +140,9 @@ class WatchListing():
         
         self.listing = await self.requestListing(self.listing.itemId)
 
-        self.prevPoll, self.remainingTime = datetime.now(), self.listing.remainingTime
+        self.prevPoll, self.remainingTime = datetime.now(timezone.utc), self.listing.remainingTime
+        self.endsAt = self.anchorEnd(self.listing, self.prevPoll, self.endsAt)
+        self.pollingInterval = self.getInterval(self.prevPoll)
 
         return self.listing.currentPrice != prev_listing.currentPrice
 
@@ -79,7 +151,7 @@ class WatchListing():
         '''
         Checks whether or not the polling time has passed returns a bool
         '''
-        return self.prevPoll + timedelta(seconds = self.pollingInterval) <= datetime.now()
+        return self.prevPoll + timedelta(seconds = self.pollingInterval) <= datetime.now(timezone.utc)
 
 
     def __hash__(self) -> int:
@@ -97,17 +169,15 @@ class WatchListing():
 
 
     @staticmethod
-    async def requestListing(itemId):
-        URL = "https://buyerapi.shopgoodwill.com/api/ItemDetail/GetItemDetailModelByItemId/"
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"{URL}{itemId}") as response:
-                json_data = await response.json()
+    async def requestListing(itemId, priority: int = BACKGROUND):
+        json_data = await getItemDetail(itemId, priority = priority)
 
-                return SimpleListing.fromDict(json_data)
+        return SimpleListing.fromDict(json_data)
 
     
 class UserData():
+    __slots__ = ("uid", "category", "watchListings", "thread", "guild", "lastSeen")
+
     def __init__(self, uid: int, category: int = None, 
                  watchListings: list[WatchListing] = None, 
                  thread: Thread = None, guild: Guild = None
@@ -115,184 +185,233 @@ class UserData():
 
         self.uid = uid
         self.category = category
-        self.watchListings = watchListings if watchListings else list()
-        self._event = asyncio.Event()
-        self.task = None
-        self._curPollingInterval = None
+        self.watchListings: list[WatchListing] = list()
         self.thread = thread
         self.guild = guild
+        self.lastSeen = time.monotonic()
 
+        for watchListing in watchListings or []:
+            self.addWatchListing(watchListing.listing)
 
-    def addWatchListing(self, newListing: SimpleListing) -> None:
+
+    def addWatchListing(self, newListing: SimpleListing, due: float = None, persist: bool = True) -> WatchListing:
         '''
-        Should be run if adding a watchListing after initialization to properly alert the checker.
+        Subscribes the user to the listing, items watched by several users share one WatchListing and are polled once.
         '''
-        watchListing = WatchListing(newListing)
-        self.watchListings.append(watchListing)
+        watchListing = watchScheduler.subscribe(self, WatchListing(newListing), due = due, persist = persist)
+
+        if watchListing not in self.watchListings:
+            self.watchListings.append(watchListing)
 
-        if self._curPollingInterval == None:
-            self._curPollingInterval = watchListing.getInterval()
+        return watchListing
 
-        if self.task != None:
-            self._event.set()
 
-        else:
-            self.startWatchListings()
+    def removeWatchListing(self, itemId: int) -> WatchListing:
+        '''
+        Unsubscribes the user from itemId and returns the removed watchlisting.
+        '''
+        watchListing = self.removeWatch(itemId)
 
+        if watchListing is None:
+            raise ValueError("Listing was not being watched")
 
-    async def _waitForUpdateOrTimeout(self, event: asyncio.Event, timeout: float) -> None:
-        try:
-            # Wait for the event to be set or for the timeout to elapse
-            await asyncio.wait_for(event.wait(), timeout=timeout)
-            event.clear()
+        watchScheduler.unsubscribe(self, itemId)
 
-        except asyncio.TimeoutError:
-            return
+        return watchListing
 
 
-    def getPollingInterval(self) -> int:
+    def removeWatch(self, itemId: int) -> WatchListing | None:
         '''
-        Creates a set containing waiting intervals from all watchListings and returns min value.
+        Removes itemId from watchListings without touching the scheduler, used once a listing has ended.
         '''
-        pollingIntervals = set([])
+        if itemId not in self.watchListings:
+            return None
 
-        for watchListing in self.watchListings:
-            pollingIntervals.add(watchListing.getInterval())
+        return self.watchListings.pop(self.watchListings.index(itemId))
 
-        return min(pollingIntervals)
 
+    def __hash__(self) -> int:
+        return self.uid
+    
 
-    def startWatchListings(self):
-        '''
-        Starts checkListings loop using asyncio.create_task and assigns the returned value to self.task
-        '''
-        self.task = asyncio.create_task(self.checkListings())
+@dataclass(frozen=True)
+class UserStoreStats():
+    users: int
+    watching: int # Users with at least one watch, these are never evicted
+    evicted: int
+    bytesPerUser: float
+
+
+class UserStore():
+    '''
+    User data keyed by discord user id.\n
+    Kept in least recently used order so idle users without watches can be dropped from the front.
+    '''
+
+    def __init__(self, idleTtl: float = USER_IDLE_TTL, maxUsers: int = MAX_USERS) -> None:
+        self.idleTtl = idleTtl
+        self.maxUsers = maxUsers
 
+        self._users: OrderedDict[int, UserData] = OrderedDict()
+        self._evicted = 0
+        self._lastEvict = time.monotonic()
 
-    async def checkListings(self):
-        cur_polling_interval = self.getPollingInterval()
 
-        while len(self.watchListings) > 0:
-            # list of indexes of watchlistings which have expired
-            expired: list[int] = []
+    def addUser(self, user: User, category: int = None, watchListings: list[WatchListing] = None) -> UserData:
+        if user.id in self._users:
+            raise ValueError("User already has data added")
 
-            for i in range(len(self.watchListings)):
-                watchListing = self.watchListings[i]
+        userData = UserData(
+            uid = user.id, 
+            category = category,
+            watchListings = watchListings
+        )
 
-                # Skip if polling intreval is less than the watchlistings interval
-                if watchListing.pollingInterval < cur_polling_interval and not watchListing.checkPoll():
-                    continue
+        self._users[user.id] = userData
 
-                # Update listing with most recent data
-                changed = await watchListing.checkListing()
+        if time.monotonic() - self._lastEvict > EVICT_INTERVAL or len(self._users) > self.maxUsers:
+            self.evictIdle(keep = user.id) # The new user has no watches yet but is about to be used
 
-                if watchListing.remainingTime == timedelta(seconds = 0):
-                    await watchListing.terminateWatchListing()
-                    expired.append(i)
-                    continue
+        return userData
 
 
-                if changed:
-                    await watchListing.updateWatchListing()
+    def getUser(self, user: User) -> UserData | None:
+        userData = self._users.get(user.id)
 
-            # Removes all expired watchlistings
-            [self.watchListings.pop(i) for i in expired[::-1]]
+        if userData is not None:
+            userData.lastSeen = time.monotonic()
+            self._users.move_to_end(user.id)
 
-            await self._waitForUpdateOrTimeout(event= self._event, timeout = self.getPollingInterval())
+        return userData
 
-        # Remove variables used for wathlistings
-        self._curPollingInterval = None
-        self._event = None
 
+    def evictIdle(self, keep: int = None) -> int:
+        '''
+        Drops users without watches which have been idle for idleTtl, or the least recently used ones past maxUsers.\n
+        The user with id keep is never dropped, returns the number of users dropped.
+        '''
+        now = self._lastEvict = time.monotonic()
 
-    def __hash__(self) -> str:
-        return f'{self.uid}'
-    
+        expired = []
+        over = len(self._users) - self.maxUsers
 
-@dataclass()
-class TempDataList():
-    datalist : list[UserData]
-    _setdata : set = None
+        for userData in self._users.values(): # Oldest first, stops at the first recent user once under maxUsers
+            if now - userData.lastSeen < self.idleTtl and len(expired) >= over:
+                break
 
-    def initList(self):
-        self._setdata = set([user.uid for user in self.datalist])
+            if not userData.watchListings and userData.uid != keep:
+                expired.append(userData.uid)
 
+        for uid in expired:
+            del self._users[uid]
 
-    def addUser(self, user: User, category: int = None, watchListings: list[WatchListing] = None):
-        
-        if user in self._setdata:
-            raise ValueError("User already has data added")
+        self._evicted += len(expired)
 
-        self._setdata.add(user.id)
+        return len(expired)
 
-        userData = UserData(
-            uid = user.id, 
-            category = category,
-            watchListings = watchListings
+
+    def stats(self) -> UserStoreStats:
+        users = len(self._users)
+
+        size = sys.getsizeof(self._users) + sum(
+            sys.getsizeof(userData) + sys.getsizeof(userData.watchListings)
+            for userData in self._users.values()
         )
 
-        if watchListings and len(watchListings) > 0:
-            userData.startWatchListings()
+        return UserStoreStats(
+            users = users,
+            watching = sum(1 for userData in self._users.values() if userData.watchListings),
+            evicted = self._evicted,
+            bytesPerUser = size / users if users else 0.0
+        )
 
-        self.datalist.append(userData)
 
-        return self.datalist[-1]
+    def __len__(self) -> int:
+        return len(self._users)
 
 
-    def _getUserIndex(self, user: int) -> int:
-        '''
-        Used for getting index using a discord.User obj rather than UserData
-        '''
-        if user not in self._setdata:
-            return None
+    def __contains__(self, user: User) -> bool:
+        return user.id in self._users
 
-        i = [i for i in range(len(self.datalist)) if self.datalist[i].uid == user]
 
-        if len(i) == 0:
-            return None
-        
-        return i[0]
+    def addWatchListing(self, user: User, listing: SimpleListing, guild: Guild = None, thread: Thread = None) -> WatchListing:
+        userData = self.getUser(user) or self.addUser(user = user)
 
+        moved = thread is not None and (userData.thread is None or userData.thread.id != thread.id)
 
-    def getUser(self, user: User):
-        try:
-            return self.datalist[self._getUserIndex(user.id)]
-        except TypeError:
-            return None
+        # Updates for every listing of the user are sent to their latest thread
+        userData.guild = guild or userData.guild
+        userData.thread = thread or userData.thread
 
+        watchListing = userData.addWatchListing(listing)
 
-    def addWatchListing(self, user: User, listing: SimpleListing) -> None:
-        if user in self._setdata:
-            userData = self.getUser(user)
-        
-        else:
-            userData = self.addUser(user = user)
+        if moved: # Earlier watches were saved with the old thread
+            watchScheduler.saveSubscriber(userData)
+
+        return watchListing
 
-        userData.addWatchListing(listing)
+
+    def forgetThread(self, thread: Thread) -> int:
+        '''
+        Clears thread from every user sending to it, used once discord reports it deleted.\n
+        Their notifications stop until /watchlisting gives them a new thread, returns the number of users changed.
+        '''
+        forgotten = 0
+
+        for userData in self._users.values():
+            if userData.thread is not None and userData.thread.id == thread.id:
+                userData.thread = None
+                watchScheduler.saveSubscriber(userData)
+                forgotten += 1
+
+        return forgotten
 
 
     def removeWatchListing(self, user: User, listingId: int) -> WatchListing:
         '''
         Removes watchlisting from userdata list and returns removed watchlisting
         '''
-        if user not in self._setdata:
+        userData = self.getUser(user)
+
+        if userData is None:
             raise ValueError("User has not been added to datalist or has expired")
 
-        userData = self.getUser(user)
+        return userData.removeWatchListing(int(listingId))
 
-        if listingId not in set(userData.watchListings):
-            watchListingIndex = userData.watchListings.index(listingId)
 
-            return userData.watchListings.pop(watchListingIndex)
+    async def restoreWatches(self, store: WatchStore) -> int:
+        '''
+        Resubscribes users to the watches saved in store using the last known listing state, nothing is requested upstream.\n
+        First polls keep their saved due time and order but are spread apart, all within MIN_POLL_INTERVAL from now.\n
+        Returns the number of watches restored.
+        '''
+        watches = await store.load() # Ordered by due time
 
-        else:
-            raise ValueError("Listing was not being watched")
+        now = time.time()
+        stagger = min(RESTORE_STAGGER, MIN_POLL_INTERVAL / max(len(watches), 1))
 
+        for rank, stored in enumerate(watches):
+            # Both terms grow with rank so the saved order is kept
+            due = max(stored.nextPoll or now, now + rank * stagger)
 
-    def setCategory(self, user, categoryId: int):
-        if user not in self._setdata:
-            raise ValueError("User has not been added to datalist or has expired")
+            for uid, guildId, threadId in stored.subscriptions:
+                user = Object(id = uid)
 
-        userData = self.getUser(user)
+                userData = self.getUser(user) or self.addUser(user = user)
+
+                # Only the ids are needed to send through the webhook so nothing is fetched
+                userData.guild = userData.guild or (Object(id = guildId) if guildId else None)
+                userData.thread = userData.thread or (Object(id = threadId) if threadId else None)
+
+                userData.addWatchListing(stored.listing, due = due, persist = False)
+
+            if rank % RESTORE_CHUNK == 0:
+                await asyncio.sleep(0)
+
+        return len(watches)
+
+
+    def setCategory(self, user: User, categoryId: int) -> None:
+        userData = self.getUser(user) or self.addUser(user = user)
 
         userData.category = categoryId
@@ -0,0 +1,308 @@
+import asyncio
+import heapq
+import logging
+import time
+
+from dataclasses import dataclass
+
+from discord_bot.watch_store import WatchStore, watchStore
+from goodwill.metrics import registry
+
+# Buckets in seconds, polls are expected within a few seconds of being due
+LAG_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+
+POLL_LAG = registry.histogram("watch_poll_lag_seconds", "Time between a watch being due and being polled", buckets = LAG_BUCKETS)
+
+log = logging.getLogger(__name__)
+
+# Wait before retrying an item whose request failed
+RETRY_INTERVAL = 60 # seconds
+
+# A final poll made this long after the end is counted as having missed the winning price
+FINAL_POLL_LATE = 120 # seconds
+
+
+@dataclass(frozen=True)
+class SchedulerStats():
+    watches: int
+    subscriptions: int
+    polls: int # Upstream fetches made, the poll volume
+    failures: int
+    finals: int # Listings which reached their final poll
+    missedFinals: int # Final polls made more than FINAL_POLL_LATE late
+
+    @property
+    def missedRate(self) -> float:
+        return self.missedFinals / self.finals if self.finals else 0.0
+
+
+class WatchScheduler():
+    '''
+    Polls every watched item once per due time no matter how many users watch it.\n
+    Due items are kept in a heap and handed to a fixed number of workers, results are sent to every subscriber.
+    '''
+
+    def __init__(self, workers: int = 8, store: WatchStore = None) -> None:
+        self.workers = workers
+        self.store = store
+
+        self._heap: list[tuple[float, int]] = [] # (due, itemId), entries not matching _due are stale
+        self._due: dict[int, float] = {}
+        self._watches: dict[int, 'WatchListing'] = {}
+        self._subscribers: dict[int, set['UserData']] = {}
+
+        self._queue: asyncio.Queue = None
+        self._wake: asyncio.Event = None
+        self._tasks: list[asyncio.Task] = []
+
+        self._polls = 0
+        self._failures = 0
+        self._finals = 0
+        self._missedFinals = 0
+
+
+    def start(self) -> None:
+        '''
+        Starts the dispatcher and workers, must be called from within the running event loop.
+        '''
+        if self._tasks:
+            return
+
+        # Bounded so the dispatcher waits for workers instead of queueing every due item at once
+        self._queue = asyncio.Queue(maxsize = self.workers * 2)
+        self._wake = asyncio.Event()
+
+        self._tasks.append(asyncio.create_task(self._dispatch()))
+        self._tasks.extend(asyncio.create_task(self._worker()) for _ in range(self.workers))
+
+        if self.store is not None:
+            self.store.start()
+
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+
+        await asyncio.gather(*self._tasks, return_exceptions = True)
+
+        self._tasks = []
+
+        if self.store is not None:
+            await self.store.close() # Write out anything still pending
+
+
+    def subscribe(self, userData: 'UserData', watchListing: 'WatchListing', due: float = None, persist: bool = True) -> 'WatchListing':
+        '''
+        Adds userData as a subscriber of the listing and returns the shared WatchListing for its item.\n
+        due overrides the first poll time of a new watch, persist is False when restoring from the store.
+        '''
+        itemId = watchListing.listing.itemId
+
+        if itemId not in self._watches:
+            self._watches[itemId] = watchListing
+            self._subscribers[itemId] = set()
+            self.schedule(itemId, due or watchListing.nextPoll().timestamp())
+
+            if persist:
+                self._saveWatch(itemId)
+
+        self._subscribers[itemId].add(userData)
+
+        if persist:
+            self._saveSubscription(userData, itemId)
+
+        self.start()
+
+        return self._watches[itemId]
+
+
+    def unsubscribe(self, userData: 'UserData', itemId: int) -> None:
+        subscribers = self._subscribers.get(itemId)
+
+        if subscribers is None:
+            return
+
+        subscribers.discard(userData)
+
+        if self.store is not None:
+            self.store.removeSubscription(userData.uid, itemId)
+
+        if len(subscribers) == 0:
+            self._remove(itemId)
+
+
+    def saveSubscriber(self, userData: 'UserData') -> None:
+        '''
+        Saves every subscription of userData again, used after its guild or thread changed.
+        '''
+        for watchListing in userData.watchListings:
+            if userData in self._subscribers.get(watchListing.listing.itemId, ()):
+                self._saveSubscription(userData, watchListing.listing.itemId)
+
+
+    def schedule(self, itemId: int, due: float) -> None:
+        '''
+        Sets when itemId is next polled, due is a unix timestamp.
+        '''
+        self._due[itemId] = due
+        heapq.heappush(self._heap, (due, itemId))
+
+        # Wake the dispatcher in case this is now the earliest item
+        if self._wake is not None and self._heap[0][1] == itemId:
+            self._wake.set()
+
+
+    def _remove(self, itemId: int) -> None:
+        self._watches.pop(itemId, None)
+        self._subscribers.pop(itemId, None)
+        self._due.pop(itemId, None) # Heap entry becomes stale and is skipped
+
+        if self.store is not None:
+            self.store.removeWatch(itemId)
+
+
+    def _saveSubscription(self, userData: 'UserData', itemId: int) -> None:
+        if self.store is not None:
+            self.store.saveSubscription(
+                userData.uid, itemId,
+                userData.guild.id if userData.guild else None,
+                userData.thread.id if userData.thread else None
+            )
+
+
+    def _saveWatch(self, itemId: int) -> None:
+        watchListing = self._watches.get(itemId)
+
+        if self.store is not None and watchListing is not None:
+            self.store.saveWatch(watchListing.listing, watchListing.endsAt, self._due.get(itemId))
+
+
+    def stats(self) -> SchedulerStats:
+        return SchedulerStats(
+            watches = len(self._watches),
+            subscriptions = sum(len(subscribers) for subscribers in self._subscribers.values()),
+            polls = self._polls,
+            failures = self._failures,
+            finals = self._finals,
+            missedFinals = self._missedFinals
+        )
+
+
+    def __len__(self) -> int:
+        return len(self._watches)
+
+
+    async def _dispatch(self) -> None:
+        while True:
+            # Drop stale entries left by rescheduled or removed items
+            while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+
+            if not self._heap:
+                await self._wake.wait()
+                self._wake.clear()
+                continue
+
+            due, itemId = self._heap[0]
+            delay = due - time.time()
+
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout = delay)
+                    self._wake.clear()
+
+                except asyncio.TimeoutError:
+                    pass
+
+                continue
+
+            heapq.heappop(self._heap)
+            del self._due[itemId] # Not due again until the worker reschedules it
+
+            await self._queue.put((itemId, due))
+
+
+    async def _worker(self) -> None:
+        while True:
+            itemId, due = await self._queue.get()
+
+            lag = max(0.0, time.time() - due)
+            POLL_LAG.observe(lag)
+
+            try:
+                await self._poll(itemId, lag)
+
+            except Exception:
+                log.exception("Polling watched listing failed", extra = {"itemId": itemId})
+                self._failures += 1
+
+                if itemId in self._watches:
+                    self.schedule(itemId, time.time() + RETRY_INTERVAL)
+
+            finally:
+                self._queue.task_done()
+
+
+    async def _poll(self, itemId: int, lag: float = 0.0) -> None:
+        watchListing = self._watches.get(itemId)
+
+        if watchListing is None: # Unsubscribed while queued
+            return
+
+        self._polls += 1
+        ends_at = watchListing.endsAt # Before the poll, lateness is measured against the end the poll was scheduled for
+        changed = await watchListing.checkListing()
+
+        # Sampled, see logs.SAMPLED_LOGGERS
+        log.info("Polled watched listing", extra = {"itemId": itemId, "lag": round(lag, 3), "changed": changed})
+
+        # Unsubscribed during the request, a new watch for the item is scheduled by subscribe
+        if self._watches.get(itemId) is not watchListing:
+            return
+
+        subscribers = list(self._subscribers.get(itemId, ()))
+
+        if watchListing.ended:
+            self._finals += 1
+
+            if (watchListing.prevPoll - ends_at).total_seconds() > FINAL_POLL_LATE:
+                self._missedFinals += 1
+
+            self._remove(itemId)
+
+            self._notify(subscribers, watchListing.terminateWatchListing)
+
+            for userData in subscribers:
+                userData.removeWatch(itemId)
+
+            return
+
+        self.schedule(itemId, watchListing.nextPoll().timestamp())
+        self._saveWatch(itemId)
+
+        if changed:
+            self._notify(subscribers, watchListing.updateWatchListing)
+
+
+    def _notify(self, subscribers: list['UserData'], send) -> None:
+        # Only queues the notifications, they are sent by the notification queue so polling never waits on discord
+        for userData in subscribers:
+            # Thread was deleted, nothing is sent until the user gets a new one
+            if userData.guild is None or userData.thread is None:
+                continue
+
+            try:
+                send(userData.guild, userData.thread)
+
+            except Exception: # One bad subscriber should not stop the others from being notified
+                log.exception("Queueing notification failed", extra = {"uid": userData.uid})
+
+
+watchScheduler = WatchScheduler(store = watchStore)
+
+registry.gauge("watch_items", "Unique listings being watched", func = lambda : watchScheduler.stats().watches)
+registry.gauge("watch_subscriptions", "User subscriptions to watched listings", func = lambda : watchScheduler.stats().subscriptions)
+registry.counter("watch_polls_total", "Watched listings fetched", func = lambda : watchScheduler.stats().polls)
+registry.counter("watch_poll_failures_total", "Watch polls which failed", func = lambda : watchScheduler.stats().failures)
+registry.counter("watch_finals_total", "Watched listings which reached their final poll", func = lambda : watchScheduler.stats().finals)
+registry.counter("watch_missed_finals_total", "Final polls made too long after the end", func = lambda : watchScheduler.stats().missedFinals)
@@ -1,7 +1,8 @@
 from typing import Any
 
 from math import ceil
-import traceback
+import logging
+import asyncio
 
 import random
 
@@ -10,11 +11,22 @@ import discord
 from discord import Interaction
 from discord.ui import View, Button 
 
-from goodwill.dataclasses import KeywordSearch, Listing, ItemListingDataParams, ItemListingParams
+from goodwill.dataclasses import KeywordSearch, CompactListing, ItemListingDataParams, ItemListingParams
 
 from discord_bot import Embeds
 
 
+log = logging.getLogger(__name__)
+
+PREFETCH_WINDOW = 1 # Pages kept either side of the current page
+
+
+def _ignoreResult(task: asyncio.Task):
+    # Prefetch failures are retried when the page is actually needed
+    if not task.cancelled():
+        task.exception()
+
+
 class LeftButton(Button):
 
     def __init__(self):
@@ -82,9 +94,9 @@ class FilterSelect(discord.ui.Select):
                 self.view.search_object.params.sc = values[0]
                 self.view.search_object.params.sd = values[1]
             
-            self.view.search_object.params.page = "1" # Rest page number 
+            # Cached and prefetched pages belong to the old sort order
+            self.view.resetPages()
 
-            await self.view.updateListings(interaction) # Update listings 
             return await self.view.getPage(interaction) # Update message
 
         else:
@@ -129,7 +141,7 @@ class FilterButton(Button):
     
 class KeywordResults(View):
     
-    def __init__(self, search_object: KeywordSearch, category: str, listing_data: tuple[list[Listing], int], timeout: float | None = 180):
+    def __init__(self, search_object: KeywordSearch, category: str, listing_data: tuple[list[CompactListing], int], timeout: float | None = 180):
         super().__init__(timeout=timeout)
 
         self.add_item(LeftButton())
@@ -147,6 +159,11 @@ class KeywordResults(View):
         self.page_half = 1
         self.page = 1
 
+        # Upstream pages of 40 listings kept in memory around the current page
+        self.pages: dict[int, tuple[list[CompactListing], int]] = {1: listing_data}
+        self.prefetch_tasks: dict[int, asyncio.Task] = {}
+        self.loaded_page = 1
+
         self.filter = "1|false"
         self.filterDict = {
             "1|false": "Time: Ending Soonest",
@@ -160,12 +177,86 @@ class KeywordResults(View):
         self.add_item(FilterButton(self.filterDict, self.filter))
 
 
+    def resetPages(self):
+        '''
+        Drops every loaded and prefetched page and goes back to the first page.
+        '''
+        for task in self.prefetch_tasks.values():
+            task.cancel()
+
+        self.prefetch_tasks.clear()
+        self.pages.clear()
+
+        self.loaded_page = None
+        self.page = 1
+        self.page_half = 1
+
+
+    def _trimPages(self):
+        '''
+        Keeps only pages within PREFETCH_WINDOW of the current page.
+        '''
+        window = range(self.page - PREFETCH_WINDOW, self.page + PREFETCH_WINDOW + 1)
+
+        for page in [page for page in self.pages if page not in window]:
+            del self.pages[page]
+
+        for page in [page for page in self.prefetch_tasks if page not in window]:
+            self.prefetch_tasks.pop(page).cancel()
+
+
+    def prefetchPages(self):
+        '''
+        Starts loading the next and previous pages in the background once the second half of a page is shown.
+        '''
+        if self.page_half != 2:
+            return
+
+        total_pages = ceil(self.total_listings / 40)
+
+        for page in (self.page + 1, self.page - 1):
+            if not 1 <= page <= total_pages or page in self.pages or page in self.prefetch_tasks:
+                continue
+
+            task = asyncio.create_task(self.search_object.fetchPage(page))
+            task.add_done_callback(_ignoreResult)
+
+            self.prefetch_tasks[page] = task
+
+
+    async def loadPage(self, page: int) -> tuple[list[CompactListing], int]:
+        '''
+        Returns page from memory, an in progress prefetch or a new request.
+        '''
+        if page in self.pages:
+            return self.pages[page]
+
+        task = self.prefetch_tasks.pop(page, None)
+        page_data = None
+
+        if task is not None and not task.cancelled():
+            try:
+                page_data = await task
+
+            except ValueError:
+                page_data = None
+
+        if page_data is None:
+            page_data = await self.search_object.fetchPage(page)
+
+        self.pages[page] = page_data
+
+        return page_data
+
+
     async def getPage(self, interaction: discord.Interaction):
 
-        if self.search_object.params.page != str(self.page):
-            self.search_object.params.page = str(self.page)
+        if self.loaded_page != self.page:
+            if not await self.updateListings(interaction):
+                return
 
-            await self.updateListings(interaction)
+        self._trimPages()
+        self.prefetchPages()
 
         if isinstance(self.search_object.params, ItemListingParams):    
             searchText = self.search_object.params.searchText
@@ -185,23 +276,34 @@ class KeywordResults(View):
         )
 
 
-    async def updateListings(self, interaction: discord.Interaction):
+    async def updateListings(self, interaction: discord.Interaction) -> bool:
+        '''
+        Loads listings for the current page, returns False if an error message was sent instead.
+        '''
         try:
-            response, total_listings = await self.search_object.makeRequest()
+            response, total_listings = await self.loadPage(self.page)
 
         except ValueError as e:
-            return await interaction.response.send_message(f"Error: {e}", ephemeral = True)
+            await interaction.response.send_message(f"Error: {e}", ephemeral = True)
+            return False
 
         if len(response) == 0:
-            return await interaction.response.send_message("No more pages", ephemeral = True)
+            await interaction.response.send_message("No more pages", ephemeral = True)
+            return False
             
         self.listings = response
         self.total_listings = total_listings
+        self.loaded_page = self.page
+
+        return True
+
 
+    async def on_timeout(self):
+        self.resetPages()
 
 
     async def on_error(self, interaction: discord.Interaction, error: Exception, item):
         await interaction.response.send_message('Oops! Something went wrong.', ephemeral=True)
 
         # Make sure we know what the error actually is
-        traceback.print_exception(type(error), error, error.__traceback__)    
\ No newline at end of file
+        log.error("View interaction failed", exc_info = error)    
\ No newline at end of file
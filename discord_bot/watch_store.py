@@ -0,0 +1,277 @@
+import asyncio
+import json
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from functools import partial
+
+from sqlalchemy import create_engine, event, select, delete, tuple_, Column, Integer, Float, String
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import declarative_base, Session
+
+from goodwill.dataclasses import SimpleListing, SimpleCategory
+
+log = logging.getLogger(__name__)
+
+# Pending changes are written in one transaction at most this often
+FLUSH_INTERVAL = 5 # seconds
+FLUSH_SIZE = 500 # Flush early once this many changes are pending
+
+engine = create_engine(
+    'sqlite:///discord_bot/watches.sqlite',
+    echo=False,
+    connect_args={"check_same_thread": False}
+)
+
+@event.listens_for(engine, "connect")
+def _setSqlitePragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+base = declarative_base()
+
+class DbWatch(base):
+    __tablename__ = 'Watches'
+
+    itemId = Column(Integer, primary_key = True)
+    endsAt = Column(Float) # Unix timestamps
+    nextPoll = Column(Float)
+    listing = Column(String) # Last known SimpleListing as json
+
+
+class DbSubscription(base):
+    __tablename__ = 'Subscriptions'
+
+    uid = Column(Integer, primary_key = True)
+    itemId = Column(Integer, primary_key = True, index = True)
+    guildId = Column(Integer, nullable = True)
+    threadId = Column(Integer, nullable = True)
+
+
+@dataclass(frozen=True)
+class StoredWatch():
+    listing: SimpleListing
+    nextPoll: float
+    subscriptions: tuple[tuple[int, int | None, int | None], ...] # (uid, guildId, threadId)
+
+
+def listingState(listing: SimpleListing) -> str:
+    return json.dumps({
+        "title": listing.title,
+        "itemId": listing.itemId,
+        "categoryData": [
+            listing.categoryData.categoryId,
+            listing.categoryData.categoryParentList,
+            listing.categoryData.categoryName
+        ],
+        "endTime": listing.endTime,
+        "url": listing.url,
+        "currentPrice": listing.currentPrice,
+        "recentBid": listing.recentBid,
+        "endsAt": listing.endsAt.timestamp() if listing.endsAt else None,
+        "remainingTime": listing.remainingTime.total_seconds(),
+    })
+
+
+def listingFromState(state: str, now: datetime) -> SimpleListing:
+    '''
+    Rebuilds a SimpleListing saved by listingState, remainingTime is recalculated from endsAt.
+    '''
+    data = json.loads(state)
+
+    if data["endsAt"] is None:
+        ends_at = None
+        remaining = timedelta(seconds = data["remainingTime"])
+
+    else:
+        ends_at = datetime.fromtimestamp(data["endsAt"], timezone.utc)
+        remaining = max(timedelta(0), ends_at - now)
+
+    return SimpleListing(
+        title = data["title"],
+        itemId = data["itemId"],
+        categoryData = SimpleCategory(*data["categoryData"]),
+        remainingTime = remaining,
+        endTime = data["endTime"],
+        url = data["url"],
+        currentPrice = data["currentPrice"],
+        recentBid = data["recentBid"],
+        endsAt = ends_at
+    )
+
+
+class WatchStore():
+    '''
+    Keeps watches and their subscribers in SQLite so they survive restarts.\n
+    Changes are only recorded in memory when made and written in batches by a background task.
+    '''
+
+    def __init__(self, flushInterval: float = FLUSH_INTERVAL, flushSize: int = FLUSH_SIZE) -> None:
+        self.flushInterval = flushInterval
+        self.flushSize = flushSize
+
+        # Later changes replace pending ones for the same key so each row is written once per flush
+        self._watches: dict[int, dict] = {}
+        self._watchDeletes: set[int] = set()
+        self._subscriptions: dict[tuple[int, int], dict] = {}
+        self._subscriptionDeletes: set[tuple[int, int]] = set()
+
+        self._executor = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = "watch-store") # One writer keeps flushes in order
+        self._wake: asyncio.Event = None
+        self._task: asyncio.Task = None
+
+
+    def start(self) -> None:
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._flushLoop())
+
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions = True)
+            self._task = None
+
+        await self.flush()
+
+
+    def _pending(self) -> int:
+        return len(self._watches) + len(self._watchDeletes) + len(self._subscriptions) + len(self._subscriptionDeletes)
+
+
+    def _changed(self) -> None:
+        if self._wake is not None and self._pending() >= self.flushSize:
+            self._wake.set()
+
+
+    def saveWatch(self, listing: SimpleListing, endsAt: datetime, nextPoll: float) -> None:
+        self._watchDeletes.discard(listing.itemId)
+        self._watches[listing.itemId] = {
+            "itemId": listing.itemId,
+            "endsAt": endsAt.timestamp(),
+            "nextPoll": nextPoll,
+            "listing": listingState(listing),
+        }
+        self._changed()
+
+
+    def removeWatch(self, itemId: int) -> None:
+        '''
+        Removes the watch and every subscription to it.
+        '''
+        self._watches.pop(itemId, None)
+        self._watchDeletes.add(itemId)
+
+        for key in [key for key in self._subscriptions if key[1] == itemId]:
+            del self._subscriptions[key]
+
+        self._subscriptionDeletes = {key for key in self._subscriptionDeletes if key[1] != itemId}
+        self._changed()
+
+
+    def saveSubscription(self, uid: int, itemId: int, guildId: int = None, threadId: int = None) -> None:
+        self._subscriptionDeletes.discard((uid, itemId))
+        self._subscriptions[(uid, itemId)] = {"uid": uid, "itemId": itemId, "guildId": guildId, "threadId": threadId}
+        self._changed()
+
+
+    def removeSubscription(self, uid: int, itemId: int) -> None:
+        self._subscriptions.pop((uid, itemId), None)
+        self._subscriptionDeletes.add((uid, itemId))
+        self._changed()
+
+
+    async def flush(self) -> None:
+        '''
+        Writes every pending change in a single transaction.
+        '''
+        if self._pending() == 0:
+            return
+
+        # Swap the pending changes out so new ones can be recorded while writing
+        batch = (list(self._watches.values()), self._watchDeletes, list(self._subscriptions.values()), self._subscriptionDeletes)
+
+        self._watches, self._watchDeletes, self._subscriptions, self._subscriptionDeletes = {}, set(), {}, set()
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, partial(_applyBatch, *batch))
+
+
+    async def _flushLoop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout = self.flushInterval)
+
+            except asyncio.TimeoutError:
+                pass
+
+            self._wake.clear()
+
+            try:
+                await self.flush()
+
+            except Exception: # The batch is lost but later changes are still written
+                log.exception("Writing watches failed")
+
+
+    async def load(self) -> list[StoredWatch]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, _loadWatches)
+
+
+def _upsert(table, index_elements: list[str], columns: list[str]):
+    statement = insert(table)
+
+    return statement.on_conflict_do_update(
+        index_elements = index_elements,
+        set_ = {column: statement.excluded[column] for column in columns}
+    )
+
+
+def _applyBatch(watches: list[dict], watchDeletes: set[int], subscriptions: list[dict], subscriptionDeletes: set[tuple[int, int]]) -> None:
+    base.metadata.create_all(engine)
+
+    with Session(engine) as session:
+        if watchDeletes:
+            session.execute(delete(DbWatch).where(DbWatch.itemId.in_(watchDeletes)))
+            session.execute(delete(DbSubscription).where(DbSubscription.itemId.in_(watchDeletes)))
+
+        if subscriptionDeletes:
+            session.execute(delete(DbSubscription).where(
+                tuple_(DbSubscription.uid, DbSubscription.itemId).in_(subscriptionDeletes)
+            ))
+
+        # Lists of rows run as a single executemany
+        if watches:
+            session.execute(_upsert(DbWatch, ["itemId"], ["endsAt", "nextPoll", "listing"]), watches)
+
+        if subscriptions:
+            session.execute(_upsert(DbSubscription, ["uid", "itemId"], ["guildId", "threadId"]), subscriptions)
+
+        session.commit()
+
+
+def _loadWatches() -> list[StoredWatch]:
+    base.metadata.create_all(engine)
+
+    now = datetime.now(timezone.utc)
+
+    with Session(engine) as session:
+        subscriptions: dict[int, list[tuple]] = {}
+
+        for entry in session.scalars(select(DbSubscription)):
+            subscriptions.setdefault(entry.itemId, []).append((entry.uid, entry.guildId, entry.threadId))
+
+        return [
+            StoredWatch(listingFromState(entry.listing, now), entry.nextPoll, tuple(subscriptions[entry.itemId]))
+            for entry in session.scalars(select(DbWatch).order_by(DbWatch.nextPoll))
+            if entry.itemId in subscriptions
+        ]
+
+
+watchStore = WatchStore()
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import traceback
+
+from time import monotonic
+
+import goodwill
+import discord_bot
+from goodwill.metrics import registry
+
+log = logging.getLogger(__name__)
+
+# Heartbeats are scheduled this often, any extra delay is loop lag
+HEARTBEAT_INTERVAL = 0.1 # seconds
+LAG_THRESHOLD = 0.25 # A stall this long is reported with the blocking stack
+
+LAG_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+LOOP_LAG = registry.histogram("event_loop_lag_seconds", "Delay of the event loop heartbeat past its interval", buckets = LAG_BUCKETS)
+LOOP_STALLS = registry.counter("event_loop_stalls_total", "Times the event loop was blocked past the threshold")
+
+# Frames from these packages are what we can fix, the innermost one is reported as the culprit
+_PROJECT_ROOTS = tuple(os.path.dirname(os.path.abspath(package.__file__)) + os.sep for package in (goodwill, discord_bot))
+
+
+def _isProjectFrame(filename: str) -> bool:
+    return os.path.abspath(filename).startswith(_PROJECT_ROOTS) and os.path.abspath(filename) != os.path.abspath(__file__)
+
+
+class LoopWatchdog():
+    '''
+    Measures event loop lag with a heartbeat coroutine.\n
+    A helper thread watches the heartbeat, if it stops for longer than threshold the loop threads stack is captured
+    and the innermost goodwill or discord_bot frame is reported as the blocking call.
+    '''
+
+    def __init__(self, interval: float = HEARTBEAT_INTERVAL, threshold: float = LAG_THRESHOLD) -> None:
+        self.interval = interval
+        self.threshold = threshold
+
+        self._beat = monotonic()
+        self._reported = None # Beat of the last reported stall so each stall is reported once
+        self._loopThread: int = None
+
+        self._task: asyncio.Task = None
+        self._thread: threading.Thread = None
+        self._stop = threading.Event()
+
+
+    def start(self) -> None:
+        '''
+        Starts the watchdog for the running event loop.
+        '''
+        if self._task is not None:
+            return
+
+        self._loopThread = threading.get_ident()
+        self._beat = monotonic()
+        self._stop.clear()
+
+        self._task = asyncio.create_task(self._heartbeat())
+
+        self._thread = threading.Thread(target = self._watch, name = "loop-watchdog", daemon = True)
+        self._thread.start()
+
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+
+        self._stop.set()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions = True)
+
+        self._thread.join(timeout = self.interval * 2)
+
+        self._task = None
+        self._thread = None
+
+
+    async def _heartbeat(self) -> None:
+        while True:
+            self._beat = monotonic()
+
+            await asyncio.sleep(self.interval)
+
+            LOOP_LAG.observe(max(0.0, monotonic() - self._beat - self.interval))
+
+
+    def _watch(self) -> None:
+        # Checks at twice the heartbeat rate so stalls are caught while the blocking code is still running
+        while not self._stop.wait(self.interval / 2):
+            beat = self._beat
+            stalled = monotonic() - beat - self.interval
+
+            if stalled < self.threshold or self._reported == beat:
+                continue
+
+            self._reported = beat
+
+            frame = sys._current_frames().get(self._loopThread)
+
+            if frame is None:
+                continue
+
+            LOOP_STALLS.inc()
+            self._report(stalled, traceback.extract_stack(frame))
+
+
+    def _report(self, stalled: float, stack: traceback.StackSummary) -> None:
+        culprit = next((frame for frame in reversed(stack) if _isProjectFrame(frame.filename)), None)
+
+        if culprit is not None:
+            location = f"{os.path.relpath(culprit.filename)}:{culprit.lineno} in {culprit.name}"
+
+        else:
+            location = "outside of goodwill and discord_bot"
+
+        log.warning(
+            "Event loop blocked for %.2fs at %s\n%s", stalled, location, "".join(stack.format()),
+            extra = {"stalled": round(stalled, 3)}
+        )
+
+
+watchdog = LoopWatchdog()
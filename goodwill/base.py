@@ -1,8 +1,30 @@
 import aiohttp
 from aiohttp import ClientResponse
 
-from datetime import timedelta
+from goodwill.client import getSession
+from goodwill.cache import TTLCache
+from goodwill.ratelimit import rateLimiter, INTERACTIVE
+from goodwill import decoding
+from goodwill import metrics
+from goodwill.shipping import ShippingQuote, parseShipping
+
+from dataclasses import replace
+from datetime import datetime, timedelta, timezone
+from time import perf_counter
+from email.utils import parsedate_to_datetime
 import regex as re  
+import asyncio
+import logging
+import random
+
+try:
+    from zoneinfo import ZoneInfo
+    GOODWILL_TZ = ZoneInfo("America/Los_Angeles")
+
+except (ImportError, KeyError): # No tz database available
+    GOODWILL_TZ = timezone(timedelta(hours = -8), "PST")
+
+log = logging.getLogger(__name__)
 
 # For api response error handeling
 def checkResponse(response: ClientResponse):
@@ -10,14 +32,136 @@ def checkResponse(response: ClientResponse):
         return response, f"Success: 200"
 
     else:
-        print('Error:', response.status) # TODO change this to logging    
+        log.warning("Goodwill api error", extra = {"status": response.status, "url": response.url})
         return None, f"Error: {response.status}"
-    
+
+
+# Statuses which mean upstream is overloaded and the request can be tried again
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 3
+RETRY_BASE_DELAY = 0.5 # seconds
+RETRY_MAX_DELAY = 8
+
+def parseRetryAfter(value: str | None) -> float | None:
+    '''
+    Returns seconds to wait from a Retry-After header, which is either seconds or an http date.
+    '''
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+
+    except ValueError:
+        pass
+
+    try:
+        retry_date = parsedate_to_datetime(value)
+
+    except (TypeError, ValueError):
+        return None
+
+    return max(0.0, (retry_date - datetime.now(timezone.utc)).total_seconds())
+
+
+def retryDelay(attempt: int) -> float:
+    '''
+    Exponential backoff with full jitter so retries from many callers spread out.
+    '''
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+async def sendRequest(url: str, json_params: dict = None, req_type: int = 0, headers: dict = None, 
+                      priority: int = INTERACTIVE) -> bytes:
+    '''
+    Sends request through the shared rate limiter and returns the raw response body.\n
+    GET requests are retried on 429/5xx and connection errors, POST requests are never retried.\n
+    Raises ValueError if request failed.
+    '''
+    session = await getSession()
+
+    retries = MAX_RETRIES if req_type == 1 else 0
+
+    endpoint = metrics.endpointName(url)
+    start = perf_counter()
+
+    try:
+        for attempt in range(retries + 1):
+            await rateLimiter.acquire(priority)
+
+            session_request = session.post(url, json = json_params, headers = headers) if req_type == 0 else session.get(url, headers = headers)
+
+            try:
+                async with session_request as response:
+                    metrics.HTTP_REQUESTS.inc(endpoint = endpoint, status = response.status)
+
+                    if response.status in RETRY_STATUSES:
+                        rateLimiter.onThrottle(parseRetryAfter(response.headers.get("Retry-After")))
+
+                        if attempt < retries:
+                            metrics.HTTP_RETRIES.inc(endpoint = endpoint)
+                            await asyncio.sleep(retryDelay(attempt))
+                            continue
+
+                    response, message = checkResponse(response)
+
+                    # TODO Log message here
+
+                    if not response:
+                        raise ValueError(f"Request failed please try again later: {message}")
+
+                    rateLimiter.onSuccess()
+
+                    return await response.read()
+
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                metrics.HTTP_REQUESTS.inc(endpoint = endpoint, status = "error")
+
+                if attempt < retries:
+                    metrics.HTTP_RETRIES.inc(endpoint = endpoint)
+                    await asyncio.sleep(retryDelay(attempt))
+                    continue
+
+                raise ValueError(f"Request failed please try again later: {e!r}") from e
+
+    finally:
+        metrics.HTTP_LATENCY.observe(perf_counter() - start, endpoint = endpoint)
+
 
 # Request Shipping function
-async def calculateShipping(itemId, zipCode: str, quantity: int = 1):
-    URL = "https://buyerapi.shopgoodwill.com/api/ItemDetail/CalculateShipping"
+SHIPPING_URL = "https://buyerapi.shopgoodwill.com/api/ItemDetail/CalculateShipping"
+SHIPPING_TTL = 3600 # seconds, rates rarely change during an auction
+
+# Keyed by (itemId, zipCode, quantity), every quote is also stored under its 3 digit zip prefix for zip3 lookups
+shippingCache = TTLCache(maxWeight = 4096, ttl = SHIPPING_TTL)
+metrics.registerCache("shipping", shippingCache)
 
+async def calculateShipping(itemId, zipCode: str, quantity: int = 1, zip3: bool = False) -> ShippingQuote:
+    '''
+    Returns a ShippingQuote for shipping itemId to zipCode.\n
+    Quotes are cached, with zip3 = True a cached quote for another zip with the same 3 digit prefix is reused.
+    '''
+    itemId = int(itemId)
+    zipCode = zipCode.strip()
+    prefix_key = ("zip3", itemId, zipCode[:3], quantity)
+
+    if zip3:
+        quote: ShippingQuote = shippingCache.get(prefix_key)
+
+        # Only the rates carry over, the address and text lines belong to the zip the quote was requested for
+        if quote is not None and quote.total is not None:
+            return quote if quote.zipCode == zipCode else replace(quote, zipCode = zipCode, address = None, lines = ())
+
+    async def load() -> ShippingQuote:
+        quote = await _requestShipping(itemId, zipCode, quantity)
+        shippingCache.set(prefix_key, quote)
+
+        return quote
+
+    return await shippingCache.getOrLoad((itemId, zipCode, quantity), load)
+
+
+async def _requestShipping(itemId, zipCode: str, quantity: int) -> ShippingQuote:
     json_params = {
         "itemId": itemId,
         "country": "US",
@@ -27,33 +171,9 @@ async def calculateShipping(itemId, zipCode: str, quantity: int = 1):
         "clientIP": ""
     }
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url = URL, json = json_params) as response:
-            response, message = checkResponse(response)
-
-            # TODO log message here
-
-            if not response:
-                raise ValueError(f"Request failed please try again later: {message}")
-            
-            data = await response.text()
+    data = (await sendRequest(url = SHIPPING_URL, json_params = json_params)).decode("utf-8")
 
-    # Get rid of opening <> and remove dupe spaces
-    res_str = re.sub(r"<[^/>]+>", "", data)
-    res_str = re.sub(r" {2,4}", "", res_str)
-
-    # Replace closing </> with \n and remove duplicates
-    res_str = re.sub(r"<[^>]+>|<[^>]+> ", "\n", res_str)[33:]
-    res_str = re.sub(r"\n{2,3}", "\n", res_str)
-
-    # Remove leading whitespace
-    res_str = re.sub(r"^ ", "", res_str, flags = re.MULTILINE)
-
-    # Fix address
-    adress_index = res_str.index("Address")
-    res_str = f"{res_str[:adress_index]}\n{res_str[adress_index:adress_index+8]} {res_str[adress_index+8:]}"
-
-    return res_str
+    return parseShipping(data, int(itemId), zipCode, quantity)
 
 
 def strpdeltatime(timestr: str):
@@ -85,25 +205,97 @@ def strpdeltatime(timestr: str):
     return timedelta(seconds = seconds)    
 
 
+def parseEndTime(timestr: str) -> datetime | None:
+    '''
+    Returns endTime as an aware UTC datetime, the api sends it without an offset in Pacific time ie. "2025-03-20T19:44:00".
+    '''
+    try:
+        end_time = datetime.fromisoformat(timestr)
+
+    except (TypeError, ValueError):
+        return None
+
+    if end_time.tzinfo is None:
+        end_time = end_time.replace(tzinfo = GOODWILL_TZ)
+
+    return end_time.astimezone(timezone.utc)
+
 
-async def baseMakeRequest(url: str, json_params: dict = None, req_type: int = 0, headers: dict = None):
+
+async def baseMakeRequest(url: str, json_params: dict = None, req_type: int = 0, headers: dict = None, 
+                          priority: int = INTERACTIVE, projection: dict = None):
     '''
     Used to make requests and returns json response.\n
     Raises ValueError if request failed.\n
-    req_type = 0 for post = 1 for get.
+    req_type = 0 for post = 1 for get.\n
+    priority = ratelimit.INTERACTIVE for user commands or ratelimit.BACKGROUND for polling.\n
+    projection limits the returned json to the given fields, see decoding.project.
+    '''
+    data = await sendRequest(url, json_params = json_params, req_type = req_type, headers = headers, priority = priority)
+
+    json_data = decoding.loads(data)
+
+    if projection is not None:
+        json_data = decoding.project(json_data, projection)
+
+    return json_data
+
+
+# Item detail caching
+ITEM_DETAIL_URL = "https://buyerapi.shopgoodwill.com/api/ItemDetail/GetItemDetailModelByItemId/"
+ITEM_DETAIL_MIN_TTL = 2 # seconds
+ITEM_DETAIL_MAX_TTL = 300
+
+def itemDetailTtl(json_data: dict) -> float:
+    '''
+    Returns how long an item detail response can be cached for.\n
+    Shrinks as the auction nears its end so prices stay fresh, ended auctions no longer change.
+    '''
+    remaining_str = json_data.get("remainingTime") or ""
+
+    if remaining_str == "Auction Ended":
+        return ITEM_DETAIL_MAX_TTL
+
+    try:
+        remaining = strpdeltatime(remaining_str).total_seconds()
+
+    except ValueError:
+        return ITEM_DETAIL_MIN_TTL
+
+    # 1% of the remaining time, ie. 1 day -> 5 min, 1 hour -> 36 sec, 5 min -> 3 sec
+    return min(ITEM_DETAIL_MAX_TTL, max(ITEM_DETAIL_MIN_TTL, remaining * 0.01))
+
+
+def itemDetailWeight(json_data: dict) -> int:
+    '''
+    Rough size in bytes of a cached item detail, the description html is the bulk of it.
     '''
-    async with aiohttp.ClientSession() as session:
-        session_request = session.post(url, json = json_params) if req_type == 0 else session.get(url)
+    return 2048 + len(json_data.get("description") or "")
+
 
-        async with session_request as response:
-            response, message = checkResponse(response)
+itemDetailCache = TTLCache(
+    maxWeight = 32 * 1024 * 1024, # 32 MiB
+    ttl = itemDetailTtl,
+    weigher = itemDetailWeight
+)
+metrics.registerCache("item_detail", itemDetailCache)
 
-            # TODO Log message here
 
-            # TODO make it so it returns error
-            if not response:
-                raise ValueError(f"Request failed please try again later: {message}")
-                
-            json_data = await response.json()
+async def getItemDetail(itemId: int | str, url: str = ITEM_DETAIL_URL, priority: int = INTERACTIVE) -> dict:
+    '''
+    Returns the json response of ItemDetail/GetItemDetailModelByItemId for itemId.\n
+    Responses are cached and concurrent requests for the same item at the same priority share one upstream request,\n
+    so a user command never waits on a background poll queued behind the rate limiter.
+    '''
+    itemId = int(itemId)
 
-    return json_data
\ No newline at end of file
+    return await itemDetailCache.getOrLoad(
+        itemId, 
+        lambda : baseMakeRequest(
+            url = f"{url}{itemId}", 
+            req_type = 1, 
+            priority = priority, 
+            projection = decoding.ITEM_DETAIL_PROJECTION # Only cache the fields which are used
+        ),
+        flight = priority
+    )
@@ -0,0 +1,170 @@
+import asyncio
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from time import monotonic
+from typing import Any, Awaitable, Callable, Hashable
+
+
+@dataclass(frozen=True, order=True)
+class CacheStats():
+    hits: int
+    misses: int
+    coalesced: int # Callers which waited on another callers request instead of making their own
+    evictions: int
+    size: int
+    weight: int
+
+    @property
+    def hitRate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class TTLCache():
+    '''
+    LRU cache with a time to live per entry and single flight loading.\n
+    maxWeight bounds the total weight of all entries, weigher returns the weight of a value (defaults to 1 per entry).\n
+    ttl can be a number of seconds or a callable which takes the loaded value and returns seconds.
+    '''
+
+    def __init__(self, maxWeight: int = 1024, ttl: float | Callable[[Any], float] = 60,
+                 weigher: Callable[[Any], int] = None
+                ) -> None:
+        self.maxWeight = maxWeight
+        self.ttl = ttl
+        self.weigher = weigher
+
+        self._data: OrderedDict[Hashable, tuple[float, int, Any]] = OrderedDict() # key: (expires, weight, value)
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+        self._weight = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+
+    def _getTtl(self, value, ttl) -> float:
+        ttl = self.ttl if ttl is None else ttl
+
+        return ttl(value) if callable(ttl) else ttl
+
+
+    def get(self, key: Hashable, default = None):
+        '''
+        Returns cached value or default if missing or expired, does not count towards hits/misses.
+        '''
+        entry = self._data.get(key)
+
+        if entry is None:
+            return default
+
+        expires, weight, value = entry
+
+        if expires <= monotonic():
+            self._remove(key)
+            return default
+
+        self._data.move_to_end(key)
+
+        return value
+
+
+    def set(self, key: Hashable, value, ttl: float | Callable[[Any], float] = None) -> None:
+        ttl = self._getTtl(value, ttl)
+
+        if ttl <= 0:
+            return
+
+        weight = self.weigher(value) if self.weigher else 1
+
+        if key in self._data:
+            self._remove(key)
+
+        self._data[key] = (monotonic() + ttl, weight, value)
+        self._weight += weight
+
+        # Evict least recently used entries until back under the bound
+        while self._weight > self.maxWeight and len(self._data) > 1:
+            old_key = next(iter(self._data))
+            self._remove(old_key)
+            self.evictions += 1
+
+
+    def _remove(self, key: Hashable) -> None:
+        expires, weight, value = self._data.pop(key)
+        self._weight -= weight
+
+
+    def invalidate(self, key: Hashable) -> None:
+        if key in self._data:
+            self._remove(key)
+
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._weight = 0
+
+
+    async def getOrLoad(self, key: Hashable, loader: Callable[[], Awaitable[Any]],
+                        ttl: float | Callable[[Any], float] = None, flight: Hashable = None):
+        '''
+        Returns the cached value for key or awaits loader to fill it.\n
+        Concurrent callers for the same key and flight share a single call to loader.\n
+        Callers with different flights load separately, ie. so a request is never left waiting on a lower priority one.
+        '''
+        _missing = object()
+        value = self.get(key, _missing)
+
+        if value is not _missing:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+
+        flight_key = key if flight is None else (key, flight)
+        task = self._inflight.get(flight_key)
+
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, loader, ttl))
+            self._inflight[flight_key] = task
+            task.add_done_callback(lambda t: self._loadDone(flight_key, t))
+
+        else:
+            self.coalesced += 1
+
+        # Shield so one caller being cancelled does not cancel the request for everyone else
+        return await asyncio.shield(task)
+
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]], ttl):
+        value = await loader()
+
+        self.set(key, value, ttl)
+
+        return value
+
+
+    def _loadDone(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+        # Mark exception as retrieved in case every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            hits = self.hits,
+            misses = self.misses,
+            coalesced = self.coalesced,
+            evictions = self.evictions,
+            size = len(self._data),
+            weight = self._weight
+        )
+
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,71 @@
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Iterable, Mapping
+
+from goodwill.dataclasses import Category
+
+
+@dataclass(frozen=True)
+class CategoryIndex():
+    '''
+    Immutable in memory view of the category tree.\n
+    Built once from the Categories table, replace the whole index to refresh it.
+    '''
+    byId: Mapping[int, Category]
+    byName: Mapping[str, tuple[Category, ...]]
+    children: Mapping[int, tuple[Category, ...]] # Keyed by parentId, -1 holds the top level categories
+    ancestors: Mapping[int, tuple[Category, ...]] # Top level first, does not include the category itself
+    catIds: Mapping[int, str] # Precomputed getCategoryIds strings
+
+    @staticmethod
+    def build(categories: Iterable[Category]) -> 'CategoryIndex':
+        by_id = {category.categoryId: category for category in categories}
+
+        by_name: dict[str, list[Category]] = {}
+        children: dict[int, list[Category]] = {}
+
+        for category in by_id.values():
+            by_name.setdefault(category.categoryName, []).append(category)
+            children.setdefault(category.parentId, []).append(category)
+
+        ancestors: dict[int, tuple[Category, ...]] = {}
+        cat_ids: dict[int, str] = {}
+
+        for category in by_id.values():
+            path = []
+            parent = by_id.get(category.parentId)
+
+            # Walk up the tree, guarding against loops in bad data
+            while parent is not None and parent not in path and parent.categoryId != category.categoryId:
+                path.append(parent)
+                parent = by_id.get(parent.parentId)
+
+            path.reverse()
+            ancestors[category.categoryId] = tuple(path)
+
+            # Api expects exactly 3 ids with -1 in place of missing parents ie. -1,456,789
+            ids = [-1, -1] + [parent.categoryId for parent in path]
+            cat_ids[category.categoryId] = ",".join(str(id) for id in ids[-2:] + [category.categoryId])
+
+        return CategoryIndex(
+            byId = MappingProxyType(by_id),
+            byName = MappingProxyType({name: tuple(cats) for name, cats in by_name.items()}),
+            children = MappingProxyType({parentId: tuple(cats) for parentId, cats in children.items()}),
+            ancestors = MappingProxyType(ancestors),
+            catIds = MappingProxyType(cat_ids),
+        )
+
+    def get(self, categoryId: int) -> Category | None:
+        return self.byId.get(int(categoryId))
+
+    def getChildren(self, categoryId: int) -> tuple[Category, ...]:
+        return self.children.get(int(categoryId), ())
+
+    def getAncestors(self, categoryId: int) -> tuple[Category, ...]:
+        return self.ancestors.get(int(categoryId), ())
+
+    def getCategoryIds(self, categoryId: int) -> str | None:
+        return self.catIds.get(int(categoryId))
+
+    def __len__(self) -> int:
+        return len(self.byId)
@@ -0,0 +1,193 @@
+import regex as re
+
+from goodwill import db
+from goodwill.dataclasses import Category
+from goodwill.category_index import CategoryIndex
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+# Discord allows at most 25 autocomplete choices with names up to 100 characters
+MAX_RESULTS = 25
+MAX_LABEL_LENGTH = 100
+
+# Match tiers, lower ranks first
+_EXACT, _NAME_PREFIX, _WORD_PREFIX, _ID_PREFIX, _FUZZY = range(5)
+
+
+def _trigrams(text: str) -> set[str]:
+    padded = f"  {text} "
+    return {padded[i:i+3] for i in range(len(padded) - 2)}
+
+
+class CategoryMatcher():
+    '''
+    Prebuilt search over category names and their full parent paths.\n
+    Word prefixes are looked up in a trie, trigram similarity is used as a fallback for typos.
+    '''
+
+    def __init__(self, index: CategoryIndex) -> None:
+        self.index = index
+
+        self.labels: dict[int, str] = {}
+        self._names: dict[int, str] = {}
+        self._trie: dict = {}
+        self._wordIds: dict[str, set[int]] = {} # Categories containing each word
+        self._trigrams: dict[str, set[str]] = {} # Words containing each trigram
+        self._gramCounts: dict[str, int] = {}
+
+        for category in index.byId.values():
+            path = [parent.categoryName for parent in index.getAncestors(category.categoryId)] + [category.categoryName]
+            label = " > ".join(path)
+
+            self.labels[category.categoryId] = label[:MAX_LABEL_LENGTH]
+            self._names[category.categoryId] = category.categoryName.lower()
+
+            for word in WORD_RE.findall(label.lower()):
+                self._addWord(word, category.categoryId)
+
+        # Top level categories are suggested before anything is typed
+        self._default = sorted(index.getChildren(-1), key = lambda category: category.categoryName)
+
+
+    def _addWord(self, word: str, categoryId: int) -> None:
+        if word not in self._wordIds:
+            self._wordIds[word] = set()
+
+            grams = _trigrams(word)
+            self._gramCounts[word] = len(grams)
+
+            for gram in grams:
+                self._trigrams.setdefault(gram, set()).add(word)
+
+        self._wordIds[word].add(categoryId)
+
+        node = self._trie
+
+        for char in word:
+            node = node.setdefault(char, {})
+            node.setdefault("", set()).add(categoryId) # "" holds ids with a word starting with this prefix
+
+
+    def _prefixIds(self, prefix: str) -> set[int]:
+        node = self._trie
+
+        for char in prefix:
+            node = node.get(char)
+
+            if node is None:
+                return set()
+
+        return node.get("", set())
+
+
+    def search(self, query: str, limit: int = MAX_RESULTS) -> list[tuple[Category, str]]:
+        '''
+        Returns up to limit (category, label) pairs best matching query, label is the full category path.
+        '''
+        query = query.strip().lower()
+
+        if not query:
+            return [(category, self.labels[category.categoryId]) for category in self._default[:limit]]
+
+        ranks: dict[int, int] = {}
+
+        # Every typed word has to start a word of the path ie. "art dra" matches "Art > Drawings"
+        words = WORD_RE.findall(query)
+
+        if words:
+            matches = self._prefixIds(words[0])
+
+            for word in words[1:]:
+                matches = matches & self._prefixIds(word)
+
+            for categoryId in matches:
+                name = self._names[categoryId]
+
+                if name == query:
+                    ranks[categoryId] = _EXACT
+
+                elif name.startswith(query):
+                    ranks[categoryId] = _NAME_PREFIX
+
+                else:
+                    ranks[categoryId] = _WORD_PREFIX
+
+        if query.isnumeric():
+            for categoryId in self.index.byId:
+                if str(categoryId).startswith(query):
+                    ranks.setdefault(categoryId, _EXACT if str(categoryId) == query else _ID_PREFIX)
+
+        scores: dict[int, float] = {}
+
+        if len(ranks) < limit and words:
+            scores = self._fuzzy(words, exclude = ranks)
+
+            for categoryId in sorted(scores, key = scores.get, reverse = True)[:limit - len(ranks)]:
+                ranks[categoryId] = _FUZZY
+
+        def sortKey(categoryId: int):
+            category = self.index.byId[categoryId]
+            return (ranks[categoryId], -scores.get(categoryId, 0), category.levelNumber, len(self.labels[categoryId]))
+
+        return [
+            (self.index.byId[categoryId], self.labels[categoryId])
+            for categoryId in sorted(ranks, key = sortKey)[:limit]
+        ]
+
+
+    def _fuzzy(self, words: list[str], exclude: dict[int, int], threshold: float = 0.3) -> dict[int, float]:
+        '''
+        Returns a score for categories loosely matching every word, used to catch typos ie. "jewlery".\n
+        Each word is compared to the words of the category paths by trigram similarity (Jaccard), the score is the average best match.
+        '''
+        totals: dict[int, float] = {}
+
+        for query_word in words:
+            grams = _trigrams(query_word)
+            shared: dict[str, int] = {}
+
+            for gram in grams:
+                for word in self._trigrams.get(gram, ()):
+                    shared[word] = shared.get(word, 0) + 1
+
+            best: dict[int, float] = {}
+
+            for word, count in shared.items():
+                similarity = count / (len(grams) + self._gramCounts[word] - count)
+
+                if similarity < threshold:
+                    continue
+
+                for categoryId in self._wordIds[word]:
+                    best[categoryId] = max(best.get(categoryId, 0), similarity)
+
+            for categoryId, similarity in best.items():
+                totals[categoryId] = totals.get(categoryId, 0) + similarity
+
+        scores = {}
+
+        for categoryId, total in totals.items():
+            score = total / len(words)
+
+            if categoryId not in exclude and score >= threshold:
+                scores[categoryId] = score
+
+        return scores
+
+
+_matcher: CategoryMatcher = None
+
+def getMatcher(index: CategoryIndex) -> CategoryMatcher:
+    '''
+    Returns a matcher for index, rebuilding it only when the index has been refreshed.
+    '''
+    global _matcher
+
+    if _matcher is None or _matcher.index is not index:
+        _matcher = CategoryMatcher(index)
+
+    return _matcher
+
+
+def searchCategories(query: str, limit: int = MAX_RESULTS) -> list[tuple[Category, str]]:
+    return getMatcher(db.getIndex()).search(query, limit)
@@ -0,0 +1,176 @@
+import asyncio
+
+from dataclasses import dataclass
+from time import perf_counter
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from goodwill import db
+from goodwill.base import baseMakeRequest
+from goodwill.ratelimit import BACKGROUND
+
+# Expected to return the same shape as categories.json, each category with its direct children
+# Not yet confirmed against the live api, so the bot only schedules the sync when CATEGORY_SYNC=1 is set
+CATEGORY_URL = "https://buyerapi.shopgoodwill.com/api/Category/GetCategoryListModel"
+SYNC_CONCURRENCY = 5
+
+_COLUMNS = ("categoryName", "parentId", "levelNumber", "subCount", "children")
+
+
+@dataclass(frozen=True, order=True)
+class SyncReport():
+    fetched: int
+    added: int
+    changed: int
+    removed: int
+    fetchSeconds: float
+    writeSeconds: float
+
+    @property
+    def seconds(self) -> float:
+        return self.fetchSeconds + self.writeSeconds
+
+
+def _toRow(model: dict) -> dict:
+    '''
+    Converts a category model from the api into a Categories row.
+    '''
+    # Stored as a CSV of child ids including the "All ..." entry which repeats the parents id ie. "15,70,368"
+    children = [child["categoryId"] for child in model.get("children") or []]
+
+    return {
+        "categoryId": model["categoryId"],
+        "categoryName": model["name"],
+        "parentId": model["parentId"],
+        "levelNumber": model["levelNumber"],
+        "subCount": model["subCount"],
+        "children": ",".join(str(id) for id in children),
+    }
+
+
+async def _fetchLevel(parentId: int) -> list[dict]:
+    json_data = await baseMakeRequest(
+        url = f"{CATEGORY_URL}?parentId={parentId}",
+        req_type = 1,
+        priority = BACKGROUND
+    )
+
+    return json_data["categoryListModel"]["categoryModel"]
+
+
+async def fetchCategories(concurrency: int = SYNC_CONCURRENCY) -> dict[int, dict]:
+    '''
+    Fetches the full category tree one level at a time, requesting every parent of a level concurrently.\n
+    Returns Categories rows keyed by categoryId.
+    '''
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(parentId: int) -> list[dict]:
+        async with semaphore:
+            return await _fetchLevel(parentId)
+
+    rows: dict[int, dict] = {}
+    parents = [-1]
+
+    while parents:
+        responses = await asyncio.gather(*[fetch(parentId) for parentId in parents])
+        parents = []
+
+        for models in responses:
+            for model in models:
+                _addModel(rows, model, parents)
+
+    return rows
+
+
+def _addModel(rows: dict[int, dict], model: dict, parents: list[int], parentId: int = None) -> None:
+    '''
+    Adds model and its nested children to rows, categories whose children were not included are added to parents.
+    '''
+    # Skip "All ..." entries which repeat their parents id
+    if parentId is not None and model["categoryId"] == parentId:
+        return
+
+    if model["categoryId"] in rows:
+        return
+
+    rows[model["categoryId"]] = _toRow(model)
+
+    children = model.get("children")
+
+    if children:
+        for child in children:
+            _addModel(rows, child, parents, model["categoryId"])
+
+    elif model.get("subCount", 0) > 0:
+        parents.append(model["categoryId"])
+
+
+def _rowValues(row: dict) -> tuple:
+    return tuple(row[column] for column in _COLUMNS)
+
+
+def applyCategories(rows: dict[int, dict]) -> tuple[int, int, int]:
+    '''
+    Diffs rows against the Categories table and applies the changes in one transaction.\n
+    Returns (added, changed, removed).
+    '''
+    db.base.metadata.create_all(db.engine)
+
+    with Session(db.engine) as session:
+        existing = {
+            entry.categoryId: (entry.categoryName, entry.parentId, entry.levelNumber, entry.subCount, entry.children)
+            for entry in session.scalars(select(db.DbCategory))
+        }
+
+        added = [row for id, row in rows.items() if id not in existing]
+        changed = [row for id, row in rows.items() if id in existing and existing[id] != _rowValues(row)]
+        removed = [id for id in existing if id not in rows]
+
+        upserts = added + changed
+
+        if upserts:
+            statement = insert(db.DbCategory)
+            statement = statement.on_conflict_do_update(
+                index_elements = ["categoryId"],
+                set_ = {column: statement.excluded[column] for column in _COLUMNS}
+            )
+
+            # Passing a list of rows runs as a single executemany
+            session.execute(statement, upserts)
+
+        if removed:
+            session.execute(delete(db.DbCategory).where(db.DbCategory.categoryId.in_(removed)))
+
+        session.commit()
+
+    return len(added), len(changed), len(removed)
+
+
+async def syncCategories() -> SyncReport:
+    '''
+    Refreshes the Categories table from the api and rebuilds the in memory index.\n
+    Raises ValueError if the api returned no categories, the table is left untouched.
+    '''
+    start = perf_counter()
+
+    rows = await fetchCategories()
+
+    fetched = perf_counter()
+
+    if len(rows) == 0:
+        raise ValueError("Category sync returned no categories")
+
+    added, changed, removed = await db.runDb(applyCategories, rows)
+    await db.refreshIndexAsync()
+
+    return SyncReport(
+        fetched = len(rows),
+        added = added,
+        changed = changed,
+        removed = removed,
+        fetchSeconds = fetched - start,
+        writeSeconds = perf_counter() - fetched
+    )
@@ -0,0 +1,142 @@
+import aiohttp
+import asyncio
+
+from dataclasses import dataclass
+from types import SimpleNamespace
+
+
+@dataclass(frozen=True, order=True)
+class PoolStats():
+    '''
+    Snapshot of the shared connection pool.
+    '''
+    open: int       # Connections currently held open by the connector
+    idle: int       # Keep-alive connections waiting to be reused
+    acquired: int   # Connections currently serving a request
+    created: int    # Total connections created since start
+    reused: int     # Total requests which reused a pooled connection
+
+
+class HttpClient():
+    '''
+    Pooled aiohttp session, the module level client carries all shopgoodwill api traffic.\n
+    Keeps connections alive between requests so each call does not pay for a new TCP + TLS handshake.
+    '''
+
+    def __init__(self, limit: int = 100, limitPerHost: int = 20, dnsTtl: int = 300,
+                 keepaliveTimeout: float = 30, timeout: float = 30
+                ) -> None:
+        self.limit = limit
+        self.limitPerHost = limitPerHost
+        self.dnsTtl = dnsTtl
+        self.keepaliveTimeout = keepaliveTimeout
+        self.timeout = timeout
+
+        self._session: aiohttp.ClientSession = None
+        self._lock = None
+
+        self._created = 0
+        self._reused = 0
+
+
+    def configure(self, **kwargs) -> None:
+        '''
+        Updates connection settings, takes effect the next time the session is started.\n
+        Accepts limit, limitPerHost, dnsTtl, keepaliveTimeout and timeout.
+        '''
+        for key, value in kwargs.items():
+            if not hasattr(self, key) or key.startswith("_"):
+                raise ValueError(f"Unknown client setting: {key}")
+
+            setattr(self, key, value)
+
+
+    def _createSession(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit = self.limit,
+            limit_per_host = self.limitPerHost,
+            ttl_dns_cache = self.dnsTtl,
+            use_dns_cache = True,
+            keepalive_timeout = self.keepaliveTimeout,
+        )
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(self._onConnectionCreate)
+        trace_config.on_connection_reuseconn.append(self._onConnectionReuse)
+
+        return aiohttp.ClientSession(
+            connector = connector,
+            timeout = aiohttp.ClientTimeout(total = self.timeout),
+            trace_configs = [trace_config],
+        )
+
+
+    async def _onConnectionCreate(self, session, context: SimpleNamespace, params) -> None:
+        self._created += 1
+
+
+    async def _onConnectionReuse(self, session, context: SimpleNamespace, params) -> None:
+        self._reused += 1
+
+
+    async def start(self) -> aiohttp.ClientSession:
+        '''
+        Creates the shared session if it is not already open and returns it.
+        '''
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            if self._session is None or self._session.closed:
+                self._session = self._createSession()
+
+        return self._session
+
+
+    async def getSession(self) -> aiohttp.ClientSession:
+        '''
+        Returns the shared session, starting it on first use.
+        '''
+        if self._session is not None and not self._session.closed:
+            return self._session
+
+        return await self.start()
+
+
+    async def close(self) -> None:
+        '''
+        Closes the shared session and all pooled connections.
+        '''
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+        self._session = None
+
+
+    def stats(self) -> PoolStats:
+        '''
+        Returns a PoolStats snapshot of the current connection pool.
+        '''
+        idle, acquired = 0, 0
+
+        if self._session is not None and not self._session.closed:
+            connector = self._session.connector
+
+            # aiohttp does not expose these publicly so fall back to 0 if they move
+            idle = sum(len(conns) for conns in getattr(connector, "_conns", {}).values())
+            acquired = len(getattr(connector, "_acquired", ()))
+
+        return PoolStats(
+            open = idle + acquired,
+            idle = idle,
+            acquired = acquired,
+            created = self._created,
+            reused = self._reused
+        )
+
+
+client = HttpClient()
+
+
+async def getSession() -> aiohttp.ClientSession:
+    return await client.getSession()
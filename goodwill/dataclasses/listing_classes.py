@@ -1,10 +1,21 @@
 import regex as re
-
-from dataclasses import dataclass
-from typing import Optional
+import asyncio
+import hashlib
+import json
+import sys
+
+from dataclasses import dataclass, replace
+from typing import Optional, AsyncIterator
+from collections import deque
+from math import ceil
 from datetime import datetime, timedelta
 
-from goodwill.base import strpdeltatime, calculateShipping, baseMakeRequest
+from goodwill.base import strpdeltatime, parseEndTime, calculateShipping, baseMakeRequest, getItemDetail
+from goodwill.cache import TTLCache
+from goodwill import metrics
+
+# Matches category names in categoryParentList ie. "|15|Art|70|Drawings"
+CATEGORY_PARENT_RE = re.compile(r"(?<=\|)[^0-9][a-zA-Z &]*")
 
 # Category classes 
 @dataclass(frozen=True, order=True)
@@ -76,6 +87,8 @@ class Listing():
 
     detailed: bool = False
 
+    endsAt: datetime = None # Absolute UTC end of the auction, endTime is only for display
+
     @staticmethod
     def fromDict(json_data:dict, req_type:int) -> 'Listing':
         '''
@@ -100,7 +113,7 @@ class Listing():
             recentBid = json_data["bidHistory"]["bidSummary"]
             recentBid = None if len(recentBid) == 0 else recentBid[0]
 
-        catParentList = json_data["catFullName"] if req_type == 0 else " > ".join(re.findall(r"(?<=\|)[^0-9][a-zA-Z &]*", json_data["categoryParentList"]))
+        catParentList = json_data["catFullName"] if req_type == 0 else " > ".join(CATEGORY_PARENT_RE.findall(json_data["categoryParentList"]))
         categoryName = json_data["categoryName"] if req_type == 0 else json_data["categoryParentList"].split("|")[-1]
         
         categoryData = SimpleCategory(json_data["categoryId"], catParentList, categoryName)
@@ -131,14 +144,15 @@ class Listing():
             minimumBid = json_data["minimumBid"], #
 
             detailed = False if req_type == 0 else True,
+            endsAt = parseEndTime(json_data["endTime"]),
 
             **image_params,
         )
 
         return listing
 
-    async def calculateShipping(self, zipCode: str, quantity: int = 1):
-        return await calculateShipping(self.itemId, zipCode, quantity)
+    async def calculateShipping(self, zipCode: str, quantity: int = 1, zip3: bool = False):
+        return await calculateShipping(self.itemId, zipCode, quantity, zip3)
 
 
 @dataclass(frozen=True, order=True) 
@@ -156,13 +170,15 @@ class SimpleListing():
     currentPrice: int
     recentBid: dict = None
 
+    endsAt: datetime = None # Absolute UTC end of the auction, endTime is only for display
+
     @staticmethod
     def getCategoryName(data: dict):
         pass # Defined in db.py to avoid circular import
 
     @staticmethod
     def fromDict(json_data: dict):
-        catParentList = " > ".join(re.findall(r"(?<=\|)[^0-9][a-zA-Z &]*", json_data["categoryParentList"]))
+        catParentList = " > ".join(CATEGORY_PARENT_RE.findall(json_data["categoryParentList"]))
 
         categoryData = SimpleCategory(
             json_data["categoryId"], 
@@ -181,7 +197,8 @@ class SimpleListing():
             endTime = datetime.fromisoformat(json_data["endTime"]).strftime("%b, %d, %I:%M"),
             currentPrice = json_data["currentPrice"],
             recentBid = recentBid,
-            url = f"https://shopgoodwill.com/item/{json_data['itemId']}"
+            url = f"https://shopgoodwill.com/item/{json_data['itemId']}",
+            endsAt = parseEndTime(json_data["endTime"])
         )
 
 
@@ -192,16 +209,158 @@ class SimpleListing():
             itemId = listing.itemId,
             categoryData = listing.categoryData, 
             remainingTime = listing.remainingTime,
+            endTime = listing.endTime,
             currentPrice = listing.currentPrice,
             recentBid = listing.recentBid,
-            url = listing.url
+            url = listing.url,
+            endsAt = listing.endsAt
         )
 
 
-    async def calculateShipping(self, zipCode: str, quantity: int = 1):
-        return await calculateShipping(self.itemId, zipCode, quantity)
+    async def calculateShipping(self, zipCode: str, quantity: int = 1, zip3: bool = False):
+        return await calculateShipping(self.itemId, zipCode, quantity, zip3)
+
+class CompactListing():
+    '''
+    Memory compact listing used for search result pages (Search/ItemListing and Search/ItemListingData).\n
+    Only scalar fields are copied on creation, remainingTime, endTime and categoryData are parsed on first access.\n
+    Has the same attributes as a non-detailed Listing, use toListing to get a full Listing.
+    '''
+    __slots__ = (
+        "itemId", "sellerId", "title", "description", "currentPrice", "numBids", "minimumBid", 
+        "buyNowPrice", "quantity", "imageUrl", 
+        "_categoryId", "_catFullName", "_categoryName", "_remainingTime", "_endTime", "_endTimeStr", "_categoryData"
+    )
+
+    # Same for every search result so kept on the class rather than per object
+    recentBid = None
+    imageServer = "https://shopgoodwillimages.azureedge.net/production/"
+    imageUrlString = None
+    detailed = False
+
+    def __init__(self, json_data: dict) -> None:
+        self.itemId: int = json_data["itemId"]
+        self.sellerId: int = json_data["sellerId"]
+        self.title: str = json_data["title"]
+        self.description: str = json_data["description"]
+        self.currentPrice = json_data["currentPrice"]
+        self.numBids: int = json_data["numBids"]
+        self.minimumBid = json_data["minimumBid"]
+        self.buyNowPrice = json_data["buyNowPrice"] if json_data["buyNowPrice"] != 0 else -1
+        self.quantity: int = json_data["itemQuantity"]
+        self.imageUrl: str = json_data["imageURL"]
+
+        # Category names repeat across listings so share one copy of each
+        self._categoryId: int = json_data["categoryId"]
+        self._catFullName: str = sys.intern(json_data["catFullName"])
+        self._categoryName: str = sys.intern(json_data["categoryName"])
+
+        # Raw strings, replaced with parsed values on first access
+        self._remainingTime: str | timedelta = json_data["remainingTime"]
+        self._endTime: str = json_data["endTime"]
+        self._endTimeStr: str = None
+        self._categoryData: SimpleCategory = None
+
+    @staticmethod
+    def fromDict(json_data: dict) -> 'CompactListing':
+        return CompactListing(json_data)
+
+    @property
+    def url(self) -> str:
+        return f"https://shopgoodwill.com/item/{self.itemId}"
+
+    @property
+    def remainingTime(self) -> timedelta | str:
+        if isinstance(self._remainingTime, str):
+            try:
+                self._remainingTime = strpdeltatime(self._remainingTime)
+
+            except ValueError:
+                pass # Leave unparsable strings as they are, same as Listing
+
+        return self._remainingTime
+
+    @property
+    def endTime(self) -> str:
+        if self._endTimeStr is None:
+            self._endTimeStr = datetime.fromisoformat(self._endTime).strftime("%b, %d, %I:%M")
+
+        return self._endTimeStr
+
+    @property
+    def endsAt(self) -> datetime | None:
+        return parseEndTime(self._endTime)
+
+    @property
+    def categoryData(self) -> SimpleCategory:
+        if self._categoryData is None:
+            self._categoryData = SimpleCategory(self._categoryId, self._catFullName, self._categoryName)
+
+        return self._categoryData
+
+    def toListing(self) -> Listing:
+        return Listing(
+            itemId = self.itemId,
+            categoryData = self.categoryData,
+            sellerId = self.sellerId,
+            title = self.title,
+            description = self.description,
+            remainingTime = self.remainingTime,
+            endTime = self.endTime,
+            url = self.url,
+            currentPrice = self.currentPrice,
+            numBids = self.numBids,
+            minimumBid = self.minimumBid,
+            buyNowPrice = self.buyNowPrice,
+            quantity = self.quantity,
+            imageUrl = self.imageUrl,
+            endsAt = self.endsAt,
+        )
+
+    def __eq__(self, value: object) -> bool:
+        if not isinstance(value, CompactListing):
+            return NotImplemented
+
+        return self.itemId == value.itemId and self.currentPrice == value.currentPrice and self.numBids == value.numBids
+
+    def __hash__(self) -> int:
+        return hash((self.itemId, self.currentPrice, self.numBids))
+
+    def __repr__(self) -> str:
+        return f"CompactListing(itemId={self.itemId!r}, title={self.title!r}, currentPrice={self.currentPrice!r})"
+
 
 # Listing api classes
+SEARCH_CACHE_TTL = 30 # seconds
+
+# Caches (listings, num_total) per search page, keyed by the params cacheKey
+searchCache = TTLCache(maxWeight = 256, ttl = SEARCH_CACHE_TTL)
+metrics.registerCache("search", searchCache)
+
+def _canonicalKey(prefix: str, params: dict) -> str:
+    '''
+    Returns a stable hash of params, values are normalized so equivalent searches share a key.
+    '''
+    canonical = {}
+
+    for key, item in params.items():
+        if isinstance(item, bool):
+            item = str(item).lower()
+
+        elif item is None:
+            item = ""
+
+        canonical[key] = str(item).strip()
+
+    encoded = json.dumps(canonical, sort_keys = True, separators = (",", ":"))
+
+    return f"{prefix}:{hashlib.sha1(encoded.encode('utf-8')).hexdigest()}"
+
+
+def _normalizeText(text: str) -> str:
+    return " ".join(str(text).split()).lower()
+
+
 @dataclass(order=True)
 class ItemListingParams():
     '''
@@ -289,6 +448,24 @@ class ItemListingParams():
         }
 
         return obj
+
+    def cacheKey(self) -> str:
+        '''
+        Returns a hash of the parameters which affect the results.\n
+        Ignores ui only flags and the ending date default unless closed auctions are being searched.
+        '''
+        obj = self.toJson()
+
+        for key in ("isFromHeaderMenuTab", "isFromHomePage", "layout"):
+            obj.pop(key)
+
+        if str(self.searchClosedAuctions).lower() != "true":
+            obj.pop("closedAuctionEndingDate")
+            obj.pop("closedAuctionDaysBack")
+
+        obj["searchText"] = _normalizeText(self.searchText)
+
+        return _canonicalKey("ItemListing", obj)
     
 @dataclass(order=True) 
 class ItemListing():
@@ -296,14 +473,22 @@ class ItemListing():
     params: ItemListingParams 
     BASEURL: str = "https://buyerapi.shopgoodwill.com/api/Search/ItemListing"
 
-    async def makeRequest(self):
+    async def makeRequest(self, cache: bool = True):
+        # Params are mutable so build the request body now rather than when the request runs
+        json_params = self.params.toJson()
+
+        if not cache:
+            return await self._request(json_params)
+
+        return await searchCache.getOrLoad(self.params.cacheKey(), lambda : self._request(json_params))
 
-        json_data = await baseMakeRequest(url = self.BASEURL, json_params = self.params.toJson())
+    async def _request(self, json_params: dict):
+        json_data = await baseMakeRequest(url = self.BASEURL, json_params = json_params)
 
         items = json_data["searchResults"]["items"]
         num_total : int = json_data["searchResults"]["itemCount"]
 
-        listings = [Listing.fromDict(item, 0) for item in items]
+        listings = [CompactListing(item) for item in items]
 
         return listings, num_total
     
@@ -340,6 +525,15 @@ class ItemListingDataParams():
             url_params += f"{key}={self._fixParamItem(item)}&"
 
         return url_params[:-1]
+
+    def cacheKey(self) -> str:
+        '''
+        Returns a hash of the url parameters with the search text normalized.
+        '''
+        obj = {key: self._fixParamItem(item) for key, item in self.__dict__.items()}
+        obj["st"] = _normalizeText(self.st)
+
+        return _canonicalKey("ItemListingData", obj)
   
     
 @dataclass(order=True)
@@ -348,11 +542,19 @@ class ItemListingData():
     params: ItemListingDataParams
     BASEURL: str = "https://buyerapi.shopgoodwill.com/api/Search/ItemListingData"
 
-    async def makeRequest(self):
-        json_data = await baseMakeRequest(url = f"{self.BASEURL}?{self.params.toUrl()}", req_type = 1)
+    async def makeRequest(self, cache: bool = True):
+        url = f"{self.BASEURL}?{self.params.toUrl()}"
+
+        if not cache:
+            return await self._request(url)
+
+        return await searchCache.getOrLoad(self.params.cacheKey(), lambda : self._request(url))
+
+    async def _request(self, url: str):
+        json_data = await baseMakeRequest(url = url, req_type = 1)
 
         items = json_data["searchResults"]["items"]
-        listings = [Listing.fromDict(item, 0) for item in items]
+        listings = [CompactListing(item) for item in items]
 
         num_total : int = json_data["searchResults"]["itemCount"]
 
@@ -364,9 +566,11 @@ class ItemListingData():
 class KeywordSearch():
     params: ItemListingDataParams | ItemListingParams
     requestObj: ItemListingData | ItemListing = None
-    data: list[Listing] = None
+    data: list[CompactListing] = None
+    page: int = 1
+    num_total: int = None
 
-    async def makeRequest(self) -> tuple[list[Listing], int]:
+    async def makeRequest(self) -> tuple[list[CompactListing], int]:
         searchType = ItemListingData if isinstance(self.params, ItemListingDataParams) else ItemListing
 
         self.requestObj = searchType(self.params)
@@ -375,25 +579,85 @@ class KeywordSearch():
 
         return self.data
 
-    async def getNextPage(self): 
-        if not isinstance(self.params, ItemListingParams):
-            self.params = ItemListingParams(
-                catIds = self.params.cids,
-                categoryId = self.params.cid,
-                categoryLevel = self.params.cl,
-                categoryLevelNo = str(self.params.cl),
-                pageNumber = self.pageNum,
-                searchText = self.params.st 
-            )
+    def pageParams(self, page: int) -> ItemListingDataParams | ItemListingParams:
+        '''
+        Returns a copy of params set to request the given page.
+        '''
+        if isinstance(self.params, ItemListingParams):
+            return replace(self.params, page = str(page))
 
-            self.requestObj = ItemListing(self.params)
+        return replace(self.params, p = page)
 
-        self.requestObj.params.pageNumber += 1
+    async def fetchPage(self, page: int, cache: bool = True) -> tuple[list[CompactListing], int]:
+        '''
+        Requests a page without changing params, safe to run alongside other requests.
+        '''
+        params = self.pageParams(page)
+        searchType = ItemListingData if isinstance(params, ItemListingDataParams) else ItemListing
 
-        self.data, self.num_total = await self.requestObj.makeRequest()
+        return await searchType(params).makeRequest(cache = cache)
+
+    async def getNextPage(self) -> list[CompactListing]: 
+        '''
+        Requests the page after the last one requested by getNextPage, starting from page 1.
+        '''
+        self.page += 1
+
+        self.data, self.num_total = await self.fetchPage(self.page)
 
         return self.data
 
+    async def iterListings(self, window: int = 4, limit: int = None) -> AsyncIterator[CompactListing]:
+        '''
+        Yields every listing of the search across all pages in sort order.\n
+        Up to window pages are requested ahead at once, pages are dropped once yielded so memory stays constant.\n
+        Stops after limit listings if given, breaking out of the loop early cancels pending requests.
+        '''
+        if limit is not None and limit <= 0:
+            return
+
+        # Pages are not cached, a full walk would otherwise fill the search cache
+        listings, num_total = await self.fetchPage(1, cache = False)
+
+        if len(listings) == 0:
+            return
+
+        total_pages = ceil(num_total / len(listings))
+
+        # Pages past the one holding the last listing wanted are never requested
+        if limit is not None:
+            total_pages = min(total_pages, ceil(limit / len(listings)))
+
+        pending: deque[asyncio.Task] = deque()
+        next_page = 2
+        yielded = 0
+
+        try:
+            while True:
+                while next_page <= total_pages and len(pending) < window:
+                    pending.append(asyncio.create_task(self.fetchPage(next_page, cache = False)))
+                    next_page += 1
+
+                for listing in listings:
+                    yield listing
+                    yielded += 1
+
+                    if limit is not None and yielded >= limit:
+                        return
+
+                if len(pending) == 0:
+                    return
+
+                listings, _ = await pending.popleft()
+
+                # Result set shrank while walking it
+                if len(listings) == 0:
+                    return
+
+        finally:
+            for task in pending:
+                task.cancel()
+
     @staticmethod
     def initParams(paramType: int = 0, **kwargs) -> (ItemListingDataParams | ItemListingParams):
         '''
@@ -413,14 +677,37 @@ class KeywordSearch():
             return ItemListingParams(**kwargs)
 
 
+@dataclass(frozen=True, order=True)
+class IdSearchResult():
+    itemId: int
+    listing: Listing = None
+    error: Exception = None
+
+
 @dataclass(frozen=True, order=True) 
 class IdSearch():
     itemId: int
     BASEURL: str = "https://buyerapi.shopgoodwill.com/api/ItemDetail/GetItemDetailModelByItemId/" 
     
     async def makeRequest(self): 
-        url = f"{self.BASEURL}{self.itemId}"
+        json_data = await getItemDetail(self.itemId, url = self.BASEURL)
 
-        json_data = await baseMakeRequest(url = url, req_type = 1)
+        return Listing.fromDict(json_data, 1)
+
+    @staticmethod
+    async def many(itemIds: list[int | str], concurrency: int = 5) -> list[IdSearchResult]:
+        '''
+        Requests every id with at most concurrency requests at once.\n
+        Returns an IdSearchResult per id in the same order, failed ids have error set instead of listing.
+        '''
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def search(itemId) -> IdSearchResult:
+            async with semaphore:
+                try:
+                    return IdSearchResult(itemId, listing = await IdSearch(itemId).makeRequest())
+
+                except Exception as e: # Any failure only affects this id
+                    return IdSearchResult(itemId, error = e)
 
-        return Listing.fromDict(json_data, 1)
\ No newline at end of file
+        return await asyncio.gather(*[search(itemId) for itemId in itemIds])
@@ -1,11 +1,43 @@
 from goodwill import Category, SimpleListing
+from goodwill.category_index import CategoryIndex
 
-from sqlalchemy import create_engine, Column, String, Integer, ForeignKey, update, and_
+from sqlalchemy import create_engine, select, bindparam, Column, String, Integer, ForeignKey, update, and_
 from sqlalchemy.orm import declarative_base, Session, relationship, backref
 from sqlalchemy.exc import IntegrityError, InterfaceError
 
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import asyncio
+import logging
+
+log = logging.getLogger(__name__)
+
+# Threads used for database access from async code, see runDb
+DB_WORKERS = 2
+
 # connect with data base
-engine = create_engine('sqlite:///goodwill/categories.sqlite', echo=False, pool_size=10, max_overflow=20)
+DB_PATH = "goodwill/categories.sqlite"
+
+# The database is checked in and almost only read, so it keeps the default rollback journal.
+# Switching it to WAL would rewrite the file header and leave -wal/-shm files next to it.
+# Only addCategory and the category sync write through engine, SQLite allows one writer at a time
+engine = create_engine(
+    f"sqlite:///{DB_PATH}", 
+    echo=False, 
+    pool_size=1, 
+    max_overflow=0,
+    connect_args={"check_same_thread": False}
+)
+
+# Lookups open the file read only so they can never change it, sized to the worker threads
+readEngine = create_engine(
+    f"sqlite:///file:{DB_PATH}?mode=ro&uri=true",
+    echo=False,
+    pool_size=DB_WORKERS,
+    max_overflow=0,
+    connect_args={"check_same_thread": False}
+)
+
 # manage tables 
 base = declarative_base()
 
@@ -41,14 +73,32 @@ class DbCategory(base):
 
         return category
 
+
+# Statements are built once so SQLAlchemy reuses their compiled form, values are passed as bind params
+_SELECT_ALL = select(DbCategory)
+_SELECT_BY_ID = select(DbCategory).where(DbCategory.categoryId == bindparam("cat_id"))
+_SELECT_BY_NAME = select(DbCategory).where(DbCategory.categoryName == bindparam("cat_name"))
+_SELECT_BY_ID_NAME = select(DbCategory).where(
+    DbCategory.categoryId == bindparam("cat_id"), 
+    DbCategory.categoryName == bindparam("cat_name")
+)
+_SELECT_TOP_LEVEL = select(DbCategory).where(DbCategory.levelNumber == 1)
+_SELECT_BY_PARENT = select(DbCategory).where(DbCategory.parentId == bindparam("parent_id"))
+
+
+def _fetchCategories(statement, **params) -> list[Category]:
+    with Session(readEngine) as session:
+        return [entry.toCategory() for entry in session.scalars(statement, params)]
+
+
 def addCategory(json_data, children):
     with Session(engine) as session:
         try: 
             session.add(DbCategory(json_data, children))
         except IntegrityError as e:#figure out how to catch errors from sqlite3 
-            print(e)
+            log.warning("Could not add category: %s", e)
         except InterfaceError as e:
-            print(e)
+            log.warning("Could not add category: %s", e)
         session.commit()
 
 # Creates Database
@@ -58,18 +108,17 @@ def getQuery(cat_id:int = None, cat_name: str = None) -> Category | None:
     '''
     Returns category with matching criteria if not found returns None.
     '''
-    with Session(engine) as session:
-        filters = []
+    if cat_id and cat_name:
+        query_response = _fetchCategories(_SELECT_BY_ID_NAME, cat_id = cat_id, cat_name = cat_name)
 
-        if cat_id:
-            filters.append(getattr(DbCategory, "categoryId") == cat_id,)
-        
-        if cat_name:
-            filters.append(getattr(DbCategory, "categoryName") == cat_name,) 
+    elif cat_id:
+        query_response = _fetchCategories(_SELECT_BY_ID, cat_id = cat_id)
 
-        query = session.query(DbCategory).filter(and_(*filters)) if filters != () else session.query(DbCategory).all()
+    elif cat_name:
+        query_response = _fetchCategories(_SELECT_BY_NAME, cat_name = cat_name)
 
-    query_response = [entry.toCategory() for entry in query]
+    else:
+        query_response = _fetchCategories(_SELECT_ALL)
 
     if len(query_response) == 1:
         return query_response[0]
@@ -81,34 +130,81 @@ def getAllCategories():
     '''
     Returns a list of all top level categories
     '''
-    with Session(engine) as session:
-        query = session.query(DbCategory).filter(getattr(DbCategory, "levelNumber") == 1)
+    return _fetchCategories(_SELECT_TOP_LEVEL)
 
-    query_response = [entry.toCategory() for entry in query]
 
-    return query_response
+def getCategoriesByPar(parentId: int) -> list[Category]:
+    return _fetchCategories(_SELECT_BY_PARENT, parent_id = parentId)
 
 
-def getCategoriesByPar(parentId: int) -> list[Category]:
-    with Session(engine) as session:
-        query = session.query(DbCategory).filter(getattr(DbCategory, "parentId") == parentId)
+# Async access, runs the functions above on a dedicated thread pool so the event loop is never blocked
+_executor = ThreadPoolExecutor(max_workers = DB_WORKERS, thread_name_prefix = "goodwill-db")
 
-    query_response = [entry.toCategory() for entry in query]
+async def runDb(func, *args, **kwargs):
+    '''
+    Runs a blocking database function on the database thread pool and returns its result.
+    '''
+    loop = asyncio.get_running_loop()
 
-    return query_response
+    return await loop.run_in_executor(_executor, partial(func, *args, **kwargs))
 
 
-def hasChildren(categoryId: int):
-    with Session(engine) as session:
-        query = session.query(DbCategory).filter(getattr(DbCategory, "categoryId") == categoryId)
+async def getQueryAsync(cat_id: int = None, cat_name: str = None) -> Category | list[Category]:
+    return await runDb(getQuery, cat_id = cat_id, cat_name = cat_name)
 
-    response = [entry.toCategory() for entry in query]
 
-    if response[0].children != None:
-        return True
+async def getAllCategoriesAsync() -> list[Category]:
+    return await runDb(getAllCategories)
 
-    else:
-        return False
+
+async def getCategoriesByParAsync(parentId: int) -> list[Category]:
+    return await runDb(getCategoriesByPar, parentId)
+
+
+async def addCategoryAsync(json_data, children) -> None:
+    return await runDb(addCategory, json_data, children)
+
+
+# In memory category tree, see CategoryIndex
+_index: CategoryIndex = None
+
+def loadIndex() -> CategoryIndex:
+    '''
+    Builds a CategoryIndex from every row of the Categories table.
+    '''
+    with Session(readEngine) as session:
+        categories = [entry.toCategory() for entry in session.query(DbCategory)]
+
+    return CategoryIndex.build(categories)
+
+
+def refreshIndex() -> CategoryIndex:
+    '''
+    Rebuilds the index from the database and swaps it in, readers see either the old or new index never a partial one.
+    '''
+    global _index
+
+    _index = loadIndex()
+
+    return _index
+
+
+async def refreshIndexAsync() -> CategoryIndex:
+    return await runDb(refreshIndex)
+
+
+def getIndex() -> CategoryIndex:
+    '''
+    Returns the current index, loading it on first use.
+    '''
+    if _index is None:
+        return refreshIndex()
+
+    return _index
+
+
+def hasChildren(categoryId: int):
+    return len(getIndex().getChildren(categoryId)) > 0
 
 
 # ADD QUERY FUNCTION TO CATEGORY CLASS
@@ -118,13 +214,13 @@ def getParentCat(self: Category):
     '''
     if self.parentId == -1:
         return None
-        
-    par_cat = getQuery(cat_id = self.parentId)
-    
-    if par_cat.parentId != -1:
-        return (getQuery(cat_id = par_cat.parentId), par_cat)
-    
-    return par_cat
+
+    ancestors = getIndex().getAncestors(self.categoryId)
+
+    if len(ancestors) >= 2:
+        return (ancestors[-2], ancestors[-1])
+
+    return ancestors[-1] if ancestors else None
 
 setattr(Category, 'getParentCat', getParentCat)
 
@@ -135,15 +231,12 @@ def getCategoryIds(self: Category):
     Returns a str containing all category ids for api request\n
     Ex. -1,456,789 (-1 will be in place of None)
     '''
-    if self.parentId == -1:
-        return f"-1,-1,{self.categoryId}" #TODO double check that this is what is done 
-    
-    par_ids : Category | tuple[Category] = self.getParentCat()
+    cat_ids = getIndex().getCategoryIds(self.categoryId)
 
-    if type(par_ids) == tuple:
-        return f"{par_ids[0].categoryId},{par_ids[1].categoryId},{self.categoryId}"
-    
-    return f"-1,{par_ids.categoryId},{self.categoryId}"
+    if cat_ids is None: # Not in the database, treat as top level
+        return f"-1,-1,{self.categoryId}"
+
+    return cat_ids
 
 setattr(Category, 'getCategoryIds', getCategoryIds)
 
@@ -156,19 +249,18 @@ def getChildren(self: Category):
     if not self.children:
         return None
     
-    categories = getCategoriesByPar(self.categoryId)
-
-    return categories
+    return getIndex().getChildren(self.categoryId)
 
 setattr(Category, 'getChildren', getChildren)
 
 @staticmethod
 def getCategoryName(data: dict):
-    categoryName = data.get(
-        "categoryName", 
-        getQuery(cat_id = data["categoryId"]).categoryName
-    )
+    categoryName = data.get("categoryName")
+
+    if categoryName is None:
+        category = getIndex().get(data["categoryId"])
+        categoryName = category.categoryName if category else ""
 
     return categoryName
 
-setattr(SimpleListing, 'getCategoryName', getCategoryName)
\ No newline at end of file
+setattr(SimpleListing, 'getCategoryName', getCategoryName)
@@ -0,0 +1,94 @@
+import json
+
+# Fastest installed json backend is used, orjson > ujson > stdlib json
+try:
+    import orjson
+    _loads = orjson.loads
+    BACKEND = "orjson"
+
+except ImportError:
+    try:
+        import ujson
+        _loads = ujson.loads
+        BACKEND = "ujson"
+
+    except ImportError:
+        _loads = json.loads
+        BACKEND = "json"
+
+
+def loads(data: bytes | str):
+    '''
+    Decodes json using the selected backend.
+    '''
+    return _loads(data)
+
+
+def setBackend(name: str) -> None:
+    '''
+    Switches decoding backend, name is "orjson", "ujson" or "json".\n
+    Raises ImportError if the backend is not installed.
+    '''
+    global _loads, BACKEND
+
+    if name == "json":
+        _loads = json.loads
+
+    elif name == "orjson":
+        import orjson
+        _loads = orjson.loads
+
+    elif name == "ujson":
+        import ujson
+        _loads = ujson.loads
+
+    else:
+        raise ValueError(f"Unknown json backend: {name}")
+
+    BACKEND = name
+
+
+def project(data, projection: dict):
+    '''
+    Returns a copy of data containing only the keys in projection.\n
+    Projection values are True to keep the value as is or a nested projection, nested projections are applied to every item of lists.\n
+    Ex. {"itemId": True, "bidHistory": {"bidSummary": True}}
+    '''
+    if isinstance(data, list):
+        return [project(item, projection) for item in data]
+
+    if not isinstance(data, dict):
+        return data
+
+    projected = {}
+
+    for key, sub_projection in projection.items():
+        if key not in data:
+            continue
+
+        value = data[key]
+        projected[key] = value if sub_projection is True or value is None else project(value, sub_projection)
+
+    return projected
+
+
+# ItemDetail/GetItemDetailModelByItemId fields read by Listing.fromDict and SimpleListing.fromDict
+ITEM_DETAIL_PROJECTION = {
+    "itemId": True,
+    "sellerId": True,
+    "title": True,
+    "description": True,
+    "categoryId": True,
+    "categoryName": True,
+    "categoryParentList": True,
+    "imageServer": True,
+    "imageUrlString": True,
+    "quantity": True,
+    "numberOfBids": True,
+    "bidHistory": {"bidSummary": True},
+    "remainingTime": True,
+    "endTime": True,
+    "currentPrice": True,
+    "buyNowPrice": True,
+    "minimumBid": True,
+}
@@ -0,0 +1,298 @@
+import os
+import regex as re
+
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Callable, Iterator
+from urllib.parse import urlsplit
+
+from aiohttp import web
+
+from goodwill.cache import TTLCache
+
+METRICS_HOST = "127.0.0.1" # Only reachable from the machine the bot runs on
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 9108))
+
+# Seconds, covers a cached lookup up to a slow request with retries
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Ids in api paths ie. GetItemDetailModelByItemId/123456
+ID_SEGMENT_RE = re.compile(r"/[0-9]+(?=/|$)")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatLabels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Metric():
+    '''
+    Base for named metrics with labels, values are kept per tuple of label values.\n
+    If func is given the values are read from it when rendered instead, it returns a number or a dict keyed by label values.
+    '''
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), func: Callable = None) -> None:
+        self.name = name
+        self.help = help
+        self.labelNames = tuple(labels)
+        self.func = func
+
+        self._values: dict[tuple[str, ...], float] = {}
+
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelNames)
+
+
+    def values(self) -> dict[tuple[str, ...], float]:
+        if self.func is None:
+            return dict(self._values)
+
+        values = self.func()
+
+        if not isinstance(values, dict):
+            return {(): values}
+
+        return {key if isinstance(key, tuple) else (str(key),): value for key, value in values.items()}
+
+
+    def get(self, **labels) -> float:
+        return self.values().get(self._key(labels), 0)
+
+
+    def render(self) -> list[str]:
+        return [
+            f"{self.name}{_formatLabels(self.labelNames, key)} {value}"
+            for key, value in self.values().items()
+        ]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, help, labels)
+
+        self.buckets = tuple(sorted(buckets))
+
+        # Per label values: (count per bucket, last one is +Inf), sum
+        self._series: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+
+        series = self._series.get(key)
+
+        if series is None:
+            series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+
+        counts, total = series
+
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+
+        else:
+            counts[-1] += 1
+
+        total[0] += value
+
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        start = perf_counter()
+
+        try:
+            yield
+
+        finally:
+            self.observe(perf_counter() - start, **labels)
+
+
+    def series(self) -> list[dict[str, str]]:
+        '''
+        Returns the label values of every series observed so far.
+        '''
+        return [dict(zip(self.labelNames, key)) for key in self._series]
+
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return sum(series[0]) if series else 0
+
+
+    def quantile(self, q: float, **labels) -> float:
+        '''
+        Estimates the q quantile by interpolating within its bucket, same as prometheus histogram_quantile.
+        '''
+        series = self._series.get(self._key(labels))
+
+        if not series or sum(series[0]) == 0:
+            return 0.0
+
+        counts = series[0]
+        rank = q * sum(counts)
+        seen = 0
+
+        for i, count in enumerate(counts):
+            if seen + count >= rank and count > 0:
+                if i == len(self.buckets): # +Inf bucket, the best answer is the highest bound
+                    return self.buckets[-1]
+
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+
+            seen += count
+
+        return self.buckets[-1]
+
+
+    def render(self) -> list[str]:
+        lines = []
+        names = self.labelNames + ("le",)
+
+        for key, (counts, total) in self._series.items():
+            cumulative = 0
+
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_formatLabels(names, key + (le,))} {cumulative}")
+
+            lines.append(f"{self.name}_sum{_formatLabels(self.labelNames, key)} {total[0]}")
+            lines.append(f"{self.name}_count{_formatLabels(self.labelNames, key)} {cumulative}")
+
+        return lines
+
+
+class Registry():
+    '''
+    Named metrics, rendered together in the prometheus text format.\n
+    Getting a metric which already exists returns it so modules can share them by name.
+    '''
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, Metric] = {}
+
+
+    def _getOrCreate(self, cls: type, name: str, *args, **kwargs) -> Metric:
+        metric = self._metrics.get(name)
+
+        if metric is None:
+            metric = self._metrics[name] = cls(name, *args, **kwargs)
+
+        elif not isinstance(metric, cls):
+            raise ValueError(f"Metric {name} is already registered as a {metric.type}")
+
+        return metric
+
+
+    def counter(self, name: str, help: str, labels: tuple[str, ...] = (), func: Callable = None) -> Counter:
+        return self._getOrCreate(Counter, name, help, labels, func)
+
+    def gauge(self, name: str, help: str, labels: tuple[str, ...] = (), func: Callable = None) -> Gauge:
+        return self._getOrCreate(Gauge, name, help, labels, func)
+
+    def histogram(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._getOrCreate(Histogram, name, help, labels, buckets)
+
+    def get(self, name: str) -> Metric | None:
+        return self._metrics.get(name)
+
+
+    def render(self) -> str:
+        lines = []
+
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.render())
+
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+# Http metrics, recorded in base.sendRequest
+HTTP_REQUESTS = registry.counter("goodwill_http_requests_total", "Goodwill api responses by endpoint and status", ("endpoint", "status"))
+HTTP_RETRIES = registry.counter("goodwill_http_retries_total", "Goodwill api requests retried", ("endpoint",))
+HTTP_LATENCY = registry.histogram("goodwill_http_request_seconds", "Goodwill api request time including retries", ("endpoint",))
+
+def endpointName(url: str) -> str:
+    '''
+    Returns the path of url with ids and the query removed so each endpoint is one label value.
+    '''
+    return ID_SEGMENT_RE.sub("", urlsplit(url).path)
+
+
+# Cache metrics, read from the caches stats when rendered
+_caches: dict[str, TTLCache] = {}
+
+def registerCache(name: str, cache: TTLCache) -> None:
+    _caches[name] = cache
+
+registry.counter("goodwill_cache_hits_total", "Cache hits", ("cache",),
+                 func = lambda : {name: cache.stats().hits for name, cache in _caches.items()})
+registry.counter("goodwill_cache_misses_total", "Cache misses", ("cache",),
+                 func = lambda : {name: cache.stats().misses for name, cache in _caches.items()})
+registry.counter("goodwill_cache_coalesced_total", "Cache loads which waited on another callers request", ("cache",),
+                 func = lambda : {name: cache.stats().coalesced for name, cache in _caches.items()})
+registry.gauge("goodwill_cache_hit_ratio", "Cache hits over lookups", ("cache",),
+               func = lambda : {name: cache.stats().hitRate for name, cache in _caches.items()})
+registry.gauge("goodwill_cache_entries", "Entries in the cache", ("cache",),
+               func = lambda : {name: cache.stats().size for name, cache in _caches.items()})
+
+def cacheStats() -> dict:
+    return {name: cache.stats() for name, cache in _caches.items()}
+
+
+async def _handleMetrics(request: web.Request) -> web.Response:
+    return web.Response(text = request.app["registry"].render(), content_type = "text/plain", charset = "utf-8")
+
+
+async def startServer(host: str = METRICS_HOST, port: int = METRICS_PORT, registry: Registry = registry) -> web.AppRunner:
+    '''
+    Serves registry at http://host:port/metrics, call cleanup on the returned runner to stop it.
+    '''
+    app = web.Application()
+    app["registry"] = registry
+    app.router.add_get("/metrics", _handleMetrics)
+
+    runner = web.AppRunner(app, access_log = None)
+    await runner.setup()
+
+    await web.TCPSite(runner, host, port).start()
+
+    return runner
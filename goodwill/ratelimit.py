@@ -0,0 +1,126 @@
+import asyncio
+
+from collections import deque
+from time import monotonic
+
+# Priority lanes, lower values are served first
+INTERACTIVE = 0 # User commands ie. /search
+BACKGROUND = 1  # Watch polling and other background jobs
+
+
+class RateLimiter():
+    '''
+    Token bucket limiting requests per second with priority lanes.\n
+    The rate adapts AIMD style, onSuccess slowly raises it and onThrottle halves it.\n
+    Waiting interactive requests are always served before background ones.
+    '''
+
+    def __init__(self, rate: float = 5, burst: int = 10, minRate: float = 0.5, maxRate: float = 20,
+                 increase: float = 1, decrease: float = 0.5
+                ) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.minRate = minRate
+        self.maxRate = maxRate
+        self.increase = increase
+        self.decrease = decrease
+
+        self._tokens = float(burst)
+        self._updated = monotonic()
+        self._blockedUntil = 0.0
+
+        self._lanes: tuple[deque[asyncio.Future], ...] = (deque(), deque())
+        self._dispatcher: asyncio.Task = None
+
+
+    def _refill(self) -> None:
+        now = monotonic()
+
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+    def _hasWaiters(self) -> bool:
+        return any(not fut.done() for lane in self._lanes for fut in lane)
+
+
+    def _nextWaiter(self) -> asyncio.Future | None:
+        for lane in self._lanes:
+            while lane:
+                fut = lane.popleft()
+
+                if not fut.done():
+                    return fut
+
+        return None
+
+
+    async def acquire(self, priority: int = INTERACTIVE) -> None:
+        '''
+        Waits until a request is allowed to be sent.
+        '''
+        self._refill()
+
+        if not self._hasWaiters() and monotonic() >= self._blockedUntil and self._tokens >= 1:
+            self._tokens -= 1
+            return
+
+        fut = asyncio.get_running_loop().create_future()
+        self._lanes[min(priority, len(self._lanes) - 1)].append(fut)
+
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+        try:
+            await fut
+
+        except asyncio.CancelledError:
+            # Token was handed out right as we were cancelled so give it back
+            if fut.done() and not fut.cancelled():
+                self._tokens += 1
+
+            raise
+
+
+    async def _dispatch(self) -> None:
+        while self._hasWaiters():
+            self._refill()
+
+            wait = self._blockedUntil - monotonic()
+
+            if wait <= 0 and self._tokens >= 1:
+                fut = self._nextWaiter()
+
+                if fut is not None:
+                    self._tokens -= 1
+                    fut.set_result(None)
+
+                continue
+
+            if wait <= 0:
+                wait = (1 - self._tokens) / self.rate
+
+            await asyncio.sleep(wait)
+
+
+    def onSuccess(self) -> None:
+        '''
+        Additive increase, the rate grows by roughly increase per second of successful requests.
+        '''
+        self.rate = min(self.maxRate, self.rate + self.increase / self.rate)
+
+
+    def onThrottle(self, retryAfter: float = None) -> None:
+        '''
+        Multiplicative decrease, also pauses all requests for retryAfter seconds if given.
+        '''
+        self._refill()
+
+        self.rate = max(self.minRate, self.rate * self.decrease)
+        self._tokens = min(self._tokens, 0)
+
+        if retryAfter:
+            self._blockedUntil = max(self._blockedUntil, monotonic() + retryAfter)
+
+
+rateLimiter = RateLimiter()
@@ -0,0 +1,121 @@
+import html
+import regex as re
+
+from dataclasses import dataclass
+from typing import Optional
+
+# Text between tags, the response is a small html fragment
+TEXT_RE = re.compile(r"(?:^|>)([^<>]+)(?=<|$)")
+MONEY_RE = re.compile(r"-?\$?\s*([0-9][0-9,]*(?:\.[0-9]+)?)")
+SPACE_RE = re.compile(r"\s+")
+
+
+@dataclass(frozen=True, order=True)
+class ShippingQuote():
+    itemId: int
+    zipCode: str
+    quantity: int = 1
+
+    carrier: Optional[str] = None
+    shipping: Optional[float] = None
+    handling: Optional[float] = None
+    total: Optional[float] = None
+    address: Optional[str] = None
+
+    lines: tuple[str, ...] = () # Every text line of the response in order
+
+    def toText(self) -> str:
+        '''
+        Returns the response as plain text lines, used when it could not be parsed into fields.
+        '''
+        return "\n".join(self.lines)
+
+    def __str__(self) -> str:
+        return self.toText()
+
+
+def _parseMoney(value: str) -> float | None:
+    match = MONEY_RE.search(value)
+
+    if not match:
+        return None
+
+    return float(match.group(1).replace(",", ""))
+
+
+def _fieldName(label: str) -> str | None:
+    label = label.lower()
+
+    if "address" in label or "zip" in label:
+        return "address"
+
+    if "total" in label:
+        return "total"
+
+    if "handling" in label:
+        return "handling"
+
+    if "carrier" in label or "service" in label or "method" in label:
+        return "carrier"
+
+    if "shipping" in label:
+        return "shipping"
+
+    return None
+
+
+def parseShipping(data: str, itemId: int, zipCode: str, quantity: int = 1) -> ShippingQuote:
+    '''
+    Parses the html returned by ItemDetail/CalculateShipping into a ShippingQuote in a single pass.\n
+    Lines are read as "Label: value" or a "Label:" line followed by its value.
+    '''
+    lines: list[str] = []
+    fields: dict[str, str] = {}
+    pending_label = None
+
+    for match in TEXT_RE.finditer(data):
+        text = SPACE_RE.sub(" ", html.unescape(match.group(1))).strip()
+
+        if not text:
+            continue
+
+        if pending_label is not None:
+            lines[-1] = f"{lines[-1]} {text}"
+            fields.setdefault(pending_label, text)
+            pending_label = None
+            continue
+
+        lines.append(text)
+
+        label, sep, value = text.partition(":")
+        field = _fieldName(label) if sep else None
+
+        if field is None:
+            continue
+
+        value = value.strip()
+
+        if value:
+            fields.setdefault(field, value)
+
+        else:
+            pending_label = field
+
+    shipping = _parseMoney(fields["shipping"]) if "shipping" in fields else None
+    handling = _parseMoney(fields["handling"]) if "handling" in fields else None
+    total = _parseMoney(fields["total"]) if "total" in fields else None
+
+    if total is None and shipping is not None:
+        total = shipping + (handling or 0)
+
+    return ShippingQuote(
+        itemId = itemId,
+        zipCode = zipCode,
+        quantity = quantity,
+        carrier = fields.get("carrier"),
+        shipping = shipping,
+        handling = handling,
+        total = total,
+        address = fields.get("address"),
+        lines = tuple(lines)
+    )
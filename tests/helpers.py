@@ -0,0 +1,22 @@
+from datetime import datetime, timedelta, timezone
+
+from goodwill.dataclasses import SimpleListing, SimpleCategory
+
+
+def makeListing(itemId: int = 1, remaining: timedelta = timedelta(hours = 1), endsAt: datetime = None,
+                price: float = 10.0, now: datetime = None) -> SimpleListing:
+    '''
+    SimpleListing as returned by the item detail endpoint, endsAt defaults to agreeing with remaining.
+    '''
+    now = now or datetime.now(timezone.utc)
+
+    return SimpleListing(
+        title = f"Listing {itemId}",
+        itemId = itemId,
+        categoryData = SimpleCategory(28, "Clothing > Men's Clothing", "Men's Clothing"),
+        remainingTime = remaining,
+        endTime = "Mar, 20, 07:44",
+        url = f"https://shopgoodwill.com/item/{itemId}",
+        currentPrice = price,
+        endsAt = endsAt if endsAt is not None else now + remaining
+    )
@@ -0,0 +1,20 @@
+import hashlib
+import os
+
+from goodwill import db
+
+
+def fileDigest(path: str) -> str:
+    with open(path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def test_lookups_leave_database_file_untouched():
+    before = fileDigest(db.DB_PATH)
+
+    assert db.getQuery(cat_id = 28).categoryName == "Men's Clothing"
+    assert db.getCategoriesByPar(10)
+    assert len(db.loadIndex()) > 0
+
+    assert fileDigest(db.DB_PATH) == before
+    assert not os.path.exists(f"{db.DB_PATH}-wal")
@@ -0,0 +1,77 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from discord_bot.base import GuildConfig
+
+
+@pytest.fixture
+def config(tmp_path):
+    path = tmp_path / "bot_config.json"
+    path.write_text(json.dumps({"guilds": {}}))
+
+    config = GuildConfig(path = str(path), flushDelay = 0.05)
+
+    # Counts writes, each one slow enough for an update to land while it runs
+    config.writes = []
+    write = config._write
+
+    def slowWrite(data: str) -> None:
+        config.writes.append(data)
+        time.sleep(0.05)
+        write(data)
+
+    config._write = slowWrite
+
+    return config
+
+
+def saved(config: GuildConfig) -> dict:
+    with open(config.path) as file:
+        return json.load(file)["guilds"]
+
+
+def test_updates_are_written_together(config):
+    async def run():
+        for guildId in (1, 2, 3):
+            config.update(guildId, forumid = guildId)
+
+        await asyncio.sleep(0.2)
+
+    asyncio.run(run())
+
+    assert len(config.writes) == 1
+    assert saved(config) == {"1": {"forumid": 1}, "2": {"forumid": 2}, "3": {"forumid": 3}}
+
+
+def test_update_during_write_is_not_lost(config):
+    async def run():
+        config.update(1, forumid = 1)
+
+        await asyncio.sleep(0.07) # First write is running in its thread
+        config.update(2, forumid = 2)
+
+        await config.close()
+
+    asyncio.run(run())
+
+    assert len(config.writes) == 2
+    assert saved(config) == {"1": {"forumid": 1}, "2": {"forumid": 2}}
+
+
+def test_close_writes_pending_changes(config):
+    async def run():
+        config.update(1, webhookurl = "https://discord.com/api/webhooks/1/token")
+        await config.close()
+
+    asyncio.run(run())
+
+    assert saved(config) == {"1": {"webhookurl": "https://discord.com/api/webhooks/1/token"}}
+
+
+def test_update_outside_event_loop_writes_immediately(config):
+    config.update(1, forumid = 1)
+
+    assert saved(config) == {"1": {"forumid": 1}}
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from goodwill import base
+from goodwill.ratelimit import INTERACTIVE, BACKGROUND
+
+
+@pytest.fixture
+def requests(monkeypatch):
+    '''
+    Item detail requests which only finish once their priority is released, records the priority of each.
+    '''
+    class Requests(list):
+        released: dict[int, asyncio.Event] = None
+
+    calls = Requests()
+
+    async def baseMakeRequest(url, req_type = 0, priority = INTERACTIVE, **kwargs):
+        calls.append(priority)
+        await calls.released[priority].wait()
+
+        return {"itemId": int(url.rsplit("/", 1)[-1]), "remainingTime": "1d 2h", "priority": priority}
+
+    monkeypatch.setattr(base, "baseMakeRequest", baseMakeRequest)
+    base.itemDetailCache.clear()
+
+    yield calls
+
+    base.itemDetailCache.clear()
+
+
+async def startRequests(requests, *priorities: int) -> list[asyncio.Task]:
+    requests.released = {INTERACTIVE: asyncio.Event(), BACKGROUND: asyncio.Event()}
+    tasks = []
+
+    for priority in priorities:
+        tasks.append(asyncio.create_task(base.getItemDetail(5, priority = priority)))
+        await asyncio.sleep(0.01) # Let each reach its upstream request in order
+
+    return tasks
+
+
+def test_interactive_does_not_wait_on_background_load(requests):
+    async def run():
+        background, interactive = await startRequests(requests, BACKGROUND, INTERACTIVE)
+
+        # Only the interactive request is let through, the background one stays queued
+        requests.released[INTERACTIVE].set()
+        result = await asyncio.wait_for(interactive, timeout = 1)
+
+        requests.released[BACKGROUND].set()
+        await background
+
+        return result
+
+    assert asyncio.run(run())["priority"] == INTERACTIVE
+    assert requests == [BACKGROUND, INTERACTIVE]
+
+
+def test_same_priority_requests_are_shared(requests):
+    async def run():
+        tasks = await startRequests(requests, BACKGROUND, BACKGROUND, BACKGROUND)
+
+        requests.released[BACKGROUND].set()
+
+        return await asyncio.gather(*tasks)
+
+    results = asyncio.run(run())
+
+    assert requests == [BACKGROUND]
+    assert all(result is results[0] for result in results)
@@ -0,0 +1,47 @@
+import asyncio
+
+from goodwill.dataclasses import KeywordSearch
+
+
+PAGE_SIZE = 3
+TOTAL = 10
+
+
+class FakeSearch(KeywordSearch):
+    '''
+    KeywordSearch serving numbered listings from memory and recording which pages were requested.
+    '''
+
+    def __init__(self) -> None:
+        super().__init__(params = KeywordSearch.initParams(paramType = 0))
+        self.requested: list[int] = []
+
+    async def fetchPage(self, page: int, cache: bool = True):
+        self.requested.append(page)
+
+        start = (page - 1) * PAGE_SIZE
+        return list(range(start, min(start + PAGE_SIZE, TOTAL))), TOTAL
+
+
+async def collect(search: KeywordSearch, **kwargs) -> list:
+    return [listing async for listing in search.iterListings(**kwargs)]
+
+
+def test_iter_listings_walks_every_page_in_order():
+    search = FakeSearch()
+
+    assert asyncio.run(collect(search)) == list(range(TOTAL))
+
+
+def test_iter_listings_stops_at_limit():
+    search = FakeSearch()
+
+    assert asyncio.run(collect(search, limit = 4)) == [0, 1, 2, 3]
+    assert sorted(search.requested) == [1, 2]
+
+
+def test_iter_listings_zero_limit_requests_nothing():
+    search = FakeSearch()
+
+    assert asyncio.run(collect(search, limit = 0)) == []
+    assert search.requested == []
@@ -0,0 +1,54 @@
+import logging
+
+import pytest
+
+from discord_bot import logs
+from goodwill.metrics import registry
+
+
+@pytest.fixture
+def logFile(tmp_path, monkeypatch):
+    monkeypatch.setattr(logs, "QUEUE_SIZE", 1)
+
+    root = logging.getLogger()
+    level, handlers = root.level, list(root.handlers)
+
+    yield tmp_path / "discord.log"
+
+    for handler in root.handlers[:]:
+        if handler not in handlers:
+            root.removeHandler(handler)
+            handler.close()
+
+    root.setLevel(level)
+
+    # setupLogging also configures these, put them back for the other tests
+    for name in ("discord", "goodwill", "discord_bot"):
+        logging.getLogger(name).setLevel(logging.NOTSET)
+
+    for name in logs.SAMPLED_LOGGERS:
+        logging.getLogger(name).filters.clear()
+
+
+def test_dropped_records_are_counted_and_reported(logFile):
+    listener = logs.setupLogging(filename = str(logFile), console = False)
+    listener.stop() # Nothing drains the queue so only the first record fits
+
+    log = logging.getLogger("discord_bot.test")
+
+    for number in range(3):
+        log.warning("Record %d", number)
+
+    assert logs.droppedRecords() == 2
+    assert registry.get("log_records_dropped_total").get() == 2
+
+    listener.start()
+    logs.stopLogging(listener)
+
+    for handler in listener.handlers:
+        handler.close()
+
+    written = logFile.read_text()
+
+    assert "Record 0" in written
+    assert "Dropped 2 log records" in written
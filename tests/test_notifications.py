@@ -0,0 +1,155 @@
+import aiohttp
+import asyncio
+
+import discord
+import pytest
+
+from discord_bot import notifications, reminders
+from discord_bot.notifications import Notification, NotificationQueue
+from discord_bot.scheduler import WatchScheduler
+
+
+class Response():
+    def __init__(self, status: int, reason: str, headers: dict = None) -> None:
+        self.status = status
+        self.reason = reason
+        self.headers = headers or {}
+
+
+def notification(itemId: int, priority: int = notifications.UPDATE, title: str = "Update") -> Notification:
+    return Notification(priority, itemId, discord.Embed(title = title))
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    '''
+    Records what would be sent through the webhook, set sent.error to raise it once instead.
+    '''
+    class Sent(list):
+        error: Exception = None
+
+    calls = Sent()
+
+    async def sendWebhook(guild, thread, **kwargs):
+        if calls.error is not None:
+            error, calls.error = calls.error, None
+            raise error
+
+        calls.append((thread.id, [embed.title for embed in kwargs["embeds"]]))
+
+    monkeypatch.setattr(notifications, "sendWebhook", sendWebhook)
+
+    return calls
+
+
+def test_deleted_thread_is_reported_once(sent):
+    gone = []
+
+    async def run():
+        queue = NotificationQueue(onThreadGone = gone.append)
+        sent.error = discord.NotFound(Response(404, "Not Found"), {"code": notifications.UNKNOWN_CHANNEL, "message": "Unknown Channel"})
+
+        queue.enqueue(discord.Object(id = 1), discord.Object(id = 2), notification(5))
+        queue.enqueue(discord.Object(id = 1), discord.Object(id = 2), notification(6))
+        await queue.close()
+
+        return queue.stats()
+
+    stats = asyncio.run(run())
+
+    assert [thread.id for thread in gone] == [2]
+    assert (stats.sent, stats.dropped, stats.pending) == (0, 2, 0)
+
+
+def test_forgotten_thread_stops_notifications(monkeypatch):
+    scheduler = WatchScheduler(workers = 1)
+    monkeypatch.setattr(reminders, "watchScheduler", scheduler)
+
+    users = reminders.UserStore()
+
+    first = users.addUser(discord.Object(id = 1))
+    second = users.addUser(discord.Object(id = 2))
+
+    for userData, threadId in ((first, 10), (second, 20)):
+        userData.guild, userData.thread = discord.Object(id = 1), discord.Object(id = threadId)
+
+    assert users.forgetThread(discord.Object(id = 10)) == 1
+    assert first.thread is None and second.thread.id == 20
+
+    notified = []
+    scheduler._notify([first, second], lambda guild, thread: notified.append(thread.id))
+
+    assert notified == [20]
+
+
+def test_thread_queue_keeps_latest_update_and_most_urgent_priority():
+    queue = notifications.ThreadQueue(discord.Object(id = 1), discord.Object(id = 2))
+
+    queue.add(notification(5, notifications.ENDING_SOON, "first"))
+    queue.add(notification(5, notifications.UPDATE, "second"))
+
+    assert queue.pending[5].embed.title == "second"
+    assert queue.pending[5].priority == notifications.ENDING_SOON
+
+
+def test_thread_queue_never_replaces_ended():
+    queue = notifications.ThreadQueue(discord.Object(id = 1), discord.Object(id = 2))
+
+    queue.add(notification(5, notifications.ENDED, "ended"))
+    queue.add(notification(5, notifications.UPDATE, "late update"))
+
+    assert queue.pending[5].embed.title == "ended"
+
+
+def test_thread_queue_takes_most_urgent_first_within_embed_limit():
+    queue = notifications.ThreadQueue(discord.Object(id = 1), discord.Object(id = 2))
+
+    for itemId in range(12):
+        queue.add(notification(itemId, notifications.UPDATE))
+
+    queue.add(notification(99, notifications.ENDED, "ended"))
+
+    batch = queue.take()
+
+    assert len(batch) == notifications.MAX_EMBEDS
+    assert batch[0].itemId == 99
+    assert len(queue.pending) == 13 - notifications.MAX_EMBEDS
+
+
+def test_rate_limited_send_is_retried(sent, monkeypatch):
+    # Fast limiters so waiting out the backoff after the 429 takes milliseconds
+    monkeypatch.setattr(notifications, "THREAD_RATE", 100)
+    monkeypatch.setattr(notifications, "WEBHOOK_RATE", 100)
+
+    async def run():
+        queue = NotificationQueue()
+        sent.error = discord.HTTPException(Response(429, "Too Many Requests", {"Retry-After": "0"}), {"code": 0, "message": "Rate limited"})
+
+        queue.enqueue(discord.Object(id = 1), discord.Object(id = 2), notification(5, title = "update"))
+        await queue.close()
+
+        return queue.stats()
+
+    stats = asyncio.run(run())
+
+    assert sent == [(2, ["update"])]
+    assert (stats.messages, stats.sent, stats.dropped) == (1, 1, 0)
+
+
+def test_connection_error_is_retried(sent, monkeypatch):
+    monkeypatch.setattr(notifications, "THREAD_RATE", 100)
+    monkeypatch.setattr(notifications, "WEBHOOK_RATE", 100)
+
+    async def run():
+        queue = NotificationQueue()
+        sent.error = aiohttp.ClientConnectionError("Connection reset")
+
+        queue.enqueue(discord.Object(id = 1), discord.Object(id = 2), notification(5, title = "update"))
+        await queue.close()
+
+        return queue.stats()
+
+    stats = asyncio.run(run())
+
+    assert sent == [(2, ["update"])]
+    assert (stats.messages, stats.sent, stats.dropped) == (1, 1, 0)
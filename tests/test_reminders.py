@@ -0,0 +1,112 @@
+import asyncio
+
+from datetime import datetime, timedelta, timezone
+
+from discord_bot import reminders
+from discord_bot.reminders import WatchListing, MIN_POLL_INTERVAL, MAX_POLL_INTERVAL, FINAL_POLL_DELAY
+
+from tests.helpers import makeListing
+
+
+def test_next_poll_shrinks_towards_the_end():
+    now = datetime.now(timezone.utc)
+
+    far = WatchListing(makeListing(remaining = timedelta(days = 3), now = now))
+    near = WatchListing(makeListing(remaining = timedelta(minutes = 10), now = now))
+
+    assert far.nextPoll(now) - now == timedelta(seconds = MAX_POLL_INTERVAL)
+    assert near.nextPoll(now) - now == timedelta(seconds = 60)
+
+
+def test_next_poll_never_passes_the_final_poll():
+    watch = WatchListing(makeListing(remaining = timedelta(seconds = 10)))
+    now = watch.prevPoll
+
+    assert watch.nextPoll(now) == watch.endsAt + timedelta(seconds = FINAL_POLL_DELAY)
+
+    # Between the end and the final poll
+    assert watch.nextPoll(watch.endsAt + timedelta(seconds = 1)) == watch.endsAt + timedelta(seconds = FINAL_POLL_DELAY)
+
+
+def test_next_poll_past_final_poll_with_time_left_waits():
+    watch = WatchListing(makeListing(remaining = timedelta(minutes = 1)))
+
+    # Auction kept going after the local end
+    now = watch.endsAt + timedelta(minutes = 5)
+
+    assert not watch.ended
+    assert watch.nextPoll(now) >= now + timedelta(seconds = MIN_POLL_INTERVAL)
+
+
+def test_extended_auction_is_reanchored_on_poll(monkeypatch):
+    watch = WatchListing(makeListing(remaining = timedelta(minutes = 1)))
+
+    # The end passed locally but goodwill still reports time left with the old endTime
+    stale_end = datetime.now(timezone.utc) - timedelta(minutes = 2)
+
+    async def requestListing(itemId, priority = None):
+        return makeListing(remaining = timedelta(minutes = 3), endsAt = stale_end)
+
+    monkeypatch.setattr(WatchListing, "requestListing", staticmethod(requestListing))
+
+    asyncio.run(watch.checkListing())
+
+    assert not watch.ended
+    assert watch.endsAt > watch.prevPoll
+    assert watch.nextPoll(watch.prevPoll) > watch.prevPoll
+
+
+def test_ended_after_polled_past_end():
+    now = datetime.now(timezone.utc)
+    watch = WatchListing(makeListing(remaining = timedelta(0), endsAt = now - timedelta(seconds = 20), now = now))
+
+    assert watch.ended
+
+    watch.remainingTime = timedelta(minutes = 1)
+
+    assert not watch.ended
+
+
+def addUsers(users: reminders.UserStore, ids, watching: bool = False) -> None:
+    for uid in ids:
+        userData = users.addUser(reminders.Object(id = uid))
+
+        if watching:
+            userData.watchListings.append(object()) # Stands in for a watch without going through the scheduler
+
+
+def test_add_user_over_capacity_keeps_new_user():
+    users = reminders.UserStore(maxUsers = 2)
+
+    addUsers(users, (1, 2), watching = True)
+
+    userData = users.addUser(reminders.Object(id = 3))
+
+    assert reminders.Object(id = 3) in users
+    assert users.getUser(reminders.Object(id = 3)) is userData
+    assert len(users) == 3 # Users with watches are never dropped
+
+
+def test_evict_drops_least_recently_used_past_capacity():
+    users = reminders.UserStore(maxUsers = 3)
+
+    addUsers(users, (1, 2, 3))
+    users.getUser(reminders.Object(id = 1)) # Now the most recently used
+
+    addUsers(users, (4,))
+
+    assert [uid for uid in (1, 2, 3, 4) if reminders.Object(id = uid) in users] == [1, 3, 4]
+    assert users.stats().evicted == 1
+
+
+def test_evict_drops_idle_users_without_watches():
+    users = reminders.UserStore(idleTtl = 60)
+
+    addUsers(users, (1, 2))
+    addUsers(users, (3,), watching = True)
+
+    for uid in (1, 3):
+        users._users[uid].lastSeen -= 120
+
+    assert users.evictIdle() == 1
+    assert [uid for uid in (1, 2, 3) if reminders.Object(id = uid) in users] == [2, 3]
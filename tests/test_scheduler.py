@@ -0,0 +1,59 @@
+import asyncio
+
+from datetime import datetime, timedelta, timezone
+
+from discord_bot.reminders import WatchListing, UserData
+from discord_bot.scheduler import WatchScheduler
+
+from tests.helpers import makeListing
+
+
+def test_poll_does_not_reschedule_after_unsubscribe(monkeypatch):
+    async def run():
+        scheduler = WatchScheduler(workers = 1)
+        user = UserData(uid = 1)
+
+        watch = scheduler.subscribe(user, WatchListing(makeListing(itemId = 5)))
+
+        async def checkListing():
+            scheduler.unsubscribe(user, 5) # User removed the watch while the request was running
+            return True
+
+        monkeypatch.setattr(watch, "checkListing", checkListing)
+
+        await scheduler._poll(5)
+        await scheduler.stop()
+
+        return scheduler
+
+    scheduler = asyncio.run(run())
+
+    assert len(scheduler) == 0
+    assert 5 not in scheduler._due
+
+
+def test_final_poll_past_tolerance_counts_as_missed(monkeypatch):
+    monkeypatch.setattr(WatchListing, "terminateWatchListing", lambda self, guild, thread: None)
+
+    async def run():
+        scheduler = WatchScheduler(workers = 1)
+        watch = scheduler.subscribe(UserData(uid = 1), WatchListing(makeListing(itemId = 5)))
+
+        # Polled ten minutes after the end, well past END_TIME_TOLERANCE
+        end = datetime.now(timezone.utc) - timedelta(minutes = 10)
+        watch.endsAt = end
+
+        async def requestListing(itemId, priority = None):
+            return makeListing(itemId = itemId, remaining = timedelta(0), endsAt = end)
+
+        monkeypatch.setattr(WatchListing, "requestListing", staticmethod(requestListing))
+
+        await scheduler._poll(5)
+        await scheduler.stop()
+
+        return scheduler.stats(), watch
+
+    stats, watch = asyncio.run(run())
+
+    assert (stats.finals, stats.missedFinals) == (1, 1)
+    assert watch.prevPoll - watch.endsAt >= timedelta(minutes = 10)
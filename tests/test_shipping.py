@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from goodwill import base
+from goodwill.shipping import parseShipping
+
+from benchmarks.harness import loadText, CALCULATE_SHIPPING
+
+
+@pytest.fixture
+def requests(monkeypatch):
+    '''
+    Serves the recorded CalculateShipping response for every request and records the zip codes asked for.
+    '''
+    requested = []
+
+    async def requestShipping(itemId, zipCode, quantity):
+        requested.append(zipCode)
+        return parseShipping(loadText(CALCULATE_SHIPPING), itemId, zipCode, quantity)
+
+    monkeypatch.setattr(base, "_requestShipping", requestShipping)
+    base.shippingCache.clear()
+
+    yield requested
+
+    base.shippingCache.clear()
+
+
+def test_exact_quotes_are_cached(requests):
+    first = asyncio.run(base.calculateShipping(1, "98409"))
+    second = asyncio.run(base.calculateShipping(1, " 98409 "))
+
+    assert requests == ["98409"]
+    assert first is second
+
+
+def test_zip3_reuses_exact_quote_for_callers_zip(requests):
+    exact = asyncio.run(base.calculateShipping(1, "98409"))
+    reused = asyncio.run(base.calculateShipping(1, "98402", zip3 = True))
+
+    assert requests == ["98409"]
+    assert reused.total == exact.total
+    assert reused.zipCode == "98402"
+    assert reused.address is None and reused.lines == ()
+
+
+def test_exact_lookup_ignores_prefix_entry(requests):
+    asyncio.run(base.calculateShipping(1, "98409"))
+    quote = asyncio.run(base.calculateShipping(1, "98402"))
+
+    assert requests == ["98409", "98402"]
+    assert quote.zipCode == "98402"
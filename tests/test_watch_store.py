@@ -0,0 +1,135 @@
+import asyncio
+import time
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine
+
+from discord_bot import reminders, watch_store
+from discord_bot.reminders import UserStore, MIN_POLL_INTERVAL
+from discord_bot.scheduler import WatchScheduler
+from discord_bot.watch_store import WatchStore, StoredWatch
+
+from tests.helpers import makeListing
+
+
+@pytest.fixture
+def engine(monkeypatch, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'watches.sqlite'}")
+    monkeypatch.setattr(watch_store, "engine", engine)
+
+    return engine
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    '''
+    Scheduler without a store in place of the bots, restored watches are not written back.\n
+    It is never started so due times can be checked without anything being polled.
+    '''
+    scheduler = WatchScheduler(workers = 1)
+    monkeypatch.setattr(scheduler, "start", lambda : None)
+    monkeypatch.setattr(reminders, "watchScheduler", scheduler)
+
+    return scheduler
+
+
+def test_store_round_trip(engine):
+    listing = makeListing(itemId = 7, price = 12.5)
+    next_poll = time.time() + 60
+
+    async def run():
+        store = WatchStore()
+
+        store.saveWatch(listing, listing.endsAt, next_poll)
+        store.saveSubscription(1, 7, 100, 200)
+        store.saveSubscription(2, 7)
+        store.saveSubscription(3, 8) # No watch for it so it is not loaded
+
+        await store.flush()
+        return await store.load()
+
+    [stored] = asyncio.run(run())
+
+    assert stored.nextPoll == next_poll
+    assert sorted(stored.subscriptions) == [(1, 100, 200), (2, None, None)]
+    assert (stored.listing.itemId, stored.listing.currentPrice, stored.listing.endsAt) == (7, 12.5, listing.endsAt)
+
+
+def test_removed_watch_is_not_loaded(engine):
+    async def run():
+        store = WatchStore()
+        listing = makeListing(itemId = 7)
+
+        store.saveWatch(listing, listing.endsAt, time.time())
+        store.saveSubscription(1, 7)
+        await store.flush()
+
+        store.removeWatch(7)
+        await store.flush()
+
+        return await store.load()
+
+    assert asyncio.run(run()) == []
+
+
+def test_restore_resubscribes_users(engine, scheduler):
+    async def run():
+        store = WatchStore()
+        listing = makeListing(itemId = 7)
+
+        store.saveWatch(listing, listing.endsAt, time.time() + 600)
+        store.saveSubscription(1, 7, 100, 200)
+        store.saveSubscription(2, 7)
+        await store.flush()
+
+        users = UserStore()
+        restored = await users.restoreWatches(store)
+        await scheduler.stop()
+
+        return users, restored
+
+    users, restored = asyncio.run(run())
+
+    assert restored == 1
+    assert scheduler.stats().subscriptions == 2
+
+    userData = users.getUser(reminders.Object(id = 1))
+
+    assert [watch.listing.itemId for watch in userData.watchListings] == [7]
+    assert (userData.guild.id, userData.thread.id) == (100, 200)
+
+
+class FakeStore():
+    def __init__(self, watches: list[StoredWatch]) -> None:
+        self.watches = watches
+
+    async def load(self) -> list[StoredWatch]:
+        return self.watches
+
+
+def test_restore_spreads_overdue_watches_in_saved_order(scheduler):
+    now = datetime.now(timezone.utc)
+    overdue = time.time() - 600
+
+    # Every watch was due while the bot was down, ids run opposite to the saved order so a tie would reorder them
+    watches = [
+        StoredWatch(makeListing(itemId = 5000 - rank, remaining = timedelta(minutes = 5), now = now), overdue + rank * 0.01, ((rank, None, None),))
+        for rank in range(5000)
+    ]
+
+    async def run():
+        restored = await UserStore(maxUsers = 10000).restoreWatches(FakeStore(watches))
+        await scheduler.stop()
+
+        return restored
+
+    start = time.time()
+
+    assert asyncio.run(run()) == 5000
+
+    dues = [scheduler._due[stored.listing.itemId] for stored in watches]
+
+    assert all(earlier < later for earlier, later in zip(dues, dues[1:]))
+    assert dues[-1] <= start + MIN_POLL_INTERVAL + 1
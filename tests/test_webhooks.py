@@ -0,0 +1,61 @@
+import asyncio
+
+from types import SimpleNamespace
+
+import pytest
+
+from discord_bot import base
+from goodwill import client
+
+WEBHOOK_URL = "https://discord.com/api/webhooks/123456789012345678/" + "a" * 68
+
+GUILD = SimpleNamespace(id = 1)
+
+
+@pytest.fixture(autouse = True)
+def guildData(monkeypatch):
+    monkeypatch.setattr(base, "getGuildData", lambda guild: {"webhookurl": WEBHOOK_URL})
+    base._webhooks.clear()
+
+
+def test_webhooks_use_their_own_session():
+    async def run():
+        webhook = await base.getWebhook(GUILD)
+
+        try:
+            assert webhook.session is await base.webhookClient.getSession()
+            assert webhook.session is not client.client._session
+
+        finally:
+            await base.closeWebhooks()
+
+    asyncio.run(run())
+
+
+def test_webhook_rebuilt_when_session_replaced():
+    async def run():
+        first = await base.getWebhook(GUILD)
+        assert await base.getWebhook(GUILD) is first
+
+        await base.webhookClient.close()
+
+        second = await base.getWebhook(GUILD)
+
+        try:
+            assert second is not first
+            assert not second.session.closed
+
+        finally:
+            await base.closeWebhooks()
+
+    asyncio.run(run())
+
+
+def test_close_drops_cached_webhooks():
+    async def run():
+        await base.getWebhook(GUILD)
+        await base.closeWebhooks()
+
+        assert base._webhooks == {}
+
+    asyncio.run(run())